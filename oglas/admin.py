@@ -8,3 +8,4 @@ admin.site.register(Ad)
 admin.site.register(Auction)
 admin.site.register(Bid)
 admin.site.register(Wishlist)
+admin.site.register(PendingImageDeletion)
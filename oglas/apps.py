@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class OglasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'oglas'
+
+    def ready(self):
+        from . import authentication  # noqa: F401 registers the principal cache receivers
+        from . import cache  # noqa: F401 registers the cache invalidation receivers
+        from . import listings  # noqa: F401 registers the read model receivers
+        from . import wishlist  # noqa: F401 registers the wishlist id cache receivers
@@ -0,0 +1,92 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+
+from .cache import cached_views, lookup_response, store_response, ad_list_namespaces, similar_ads_namespaces
+from .etags import async_etag, ad_list_etag, ad_details_etag
+from .featured import get_featured_ads
+from .models import Ad, AdListing
+from .renderers import FastJSONRenderer
+from .serializer import AdListingSerializer, AdSerializer, get_fieldset
+from .views import get_ad_list_queryset, get_ad_list_paginator, get_ad_list_serializer, \
+    get_similar_ads_queryset, sort_similar_ads
+
+# Native async counterparts of AdListView, AdDetailsView, FeaturedAdsView and SimilarAdsView. They
+# answer with the same payloads and share the response cache and ETags with the sync views, but wait
+# for Postgres on the event loop instead of holding a worker thread. Mounted by oglasBE.asgi_urls.
+
+
+class JSONResponse(HttpResponse):
+    def __init__(self, data, status=status.HTTP_200_OK):
+        super().__init__(FastJSONRenderer().render(data), content_type='application/json', status=status)
+        self.data = data
+
+
+def async_cache_response(name, namespaces=None):
+    """cache_response() for async views returning a JSONResponse."""
+    cached_views.add(name)
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(request, **kwargs):
+            key, data = await sync_to_async(lookup_response)(name, namespaces, request, kwargs)
+            if data is not None:
+                return JSONResponse(data)
+
+            response = await func(request, **kwargs)
+            await sync_to_async(store_response)(key, response)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+@require_safe
+@async_etag(ad_list_etag)
+@async_cache_response('ad-list', ad_list_namespaces)
+async def ad_list(request):
+    ads = get_ad_list_queryset(request.GET)
+    paginator = get_ad_list_paginator(request.GET)
+    try:
+        page_obj = await paginator.apaginate_queryset(ads, Request(request))
+    except NotFound as e:
+        return JSONResponse({'detail': e.detail}, status=status.HTTP_404_NOT_FOUND)
+
+    serializer = get_ad_list_serializer(ads, request.GET, page_obj, many=True)
+    return JSONResponse(paginator.get_paginated_response(serializer.data).data)
+
+
+@require_safe
+@async_etag(ad_details_etag)
+async def ad_details(request, id):
+    try:
+        ad = await AdSerializer.setup_eager_loading(Ad.objects.all()).aget(id=id)
+    except Ad.DoesNotExist:
+        return JSONResponse({'detail': 'No Ad matches the given query.'}, status=status.HTTP_404_NOT_FOUND)
+    return JSONResponse(AdSerializer(ad).data)
+
+
+@require_safe
+async def featured_ads(request):
+    serializer = AdListingSerializer(await sync_to_async(get_featured_ads)(), many=True, **get_fieldset(request.GET))
+    return JSONResponse(serializer.data)
+
+
+@require_safe
+@async_cache_response('similar-ads', similar_ads_namespaces)
+async def similar_ads(request, ad_id):
+    listing = await AdListing.objects.filter(id=ad_id).values_list('category', 'similar_ids').afirst()
+    if listing is None:
+        return JSONResponse({"error": "Ad not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    fieldset = get_fieldset(request.GET)
+    similar_ads = AdListingSerializer(**fieldset).setup_sparse_loading(get_similar_ads_queryset(ad_id, *listing))
+    similar_ads = [ad async for ad in similar_ads]
+    serializer = AdListingSerializer(sort_similar_ads(similar_ads, listing[1]), many=True, **fieldset)
+    return JSONResponse(serializer.data)
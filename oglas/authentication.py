@@ -0,0 +1,105 @@
+import hashlib
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from .models import CustomUser
+
+ACCESS_TOKEN_SALT = 'oglas.access-token'
+
+
+def principal_key(user_id):
+    return f'principal:{user_id}'
+
+
+def token_key(key):
+    # Token keys are credentials, they don't go into the cache in the clear.
+    return 'token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_cached_user(user_id):
+    """The user with ``user_id`` from the principal cache, loaded and cached on a miss."""
+    user = cache.get(principal_key(user_id))
+    if user is None:
+        user = CustomUser.objects.filter(pk=user_id).first()
+        if user is not None:
+            cache.set(principal_key(user_id), user, settings.PRINCIPAL_CACHE_TIMEOUT)
+    return user
+
+
+def issue_access_token(user):
+    """
+    Signs a token naming ``user``, valid for ACCESS_TOKEN_LIFETIME seconds. It carries the session
+    auth hash, which is derived from the password hash, so changing the password revokes it.
+    """
+    cache.set(principal_key(user.pk), user, settings.PRINCIPAL_CACHE_TIMEOUT)
+    token = signing.dumps({'user': user.pk, 'hash': user.get_session_auth_hash()}, salt=ACCESS_TOKEN_SALT)
+    return {'access_token': token, 'token_type': 'Bearer', 'expires_in': settings.ACCESS_TOKEN_LIFETIME}
+
+
+class AccessTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates ``Authorization: Bearer <token>`` headers carrying an access token. The
+    signature is checked in memory and the user comes from the principal cache, so a request
+    costs neither a password hash nor a query while the user is cached.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid access token header.'))
+
+        try:
+            payload = signing.loads(auth[1].decode(), salt=ACCESS_TOKEN_SALT, max_age=settings.ACCESS_TOKEN_LIFETIME)
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed(_('Access token expired.'))
+        except (signing.BadSignature, UnicodeError):
+            raise exceptions.AuthenticationFailed(_('Invalid access token.'))
+
+        user = get_cached_user(payload['user'])
+        if user is None or not user.is_active or not constant_time_compare(payload['hash'], user.get_session_auth_hash()):
+            raise exceptions.AuthenticationFailed(_('Invalid access token.'))
+        return user, None
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that remembers which user a token belongs to instead of querying every time."""
+
+    def authenticate_credentials(self, key):
+        user_id = cache.get(token_key(key))
+        user = get_cached_user(user_id) if user_id is not None else None
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(token_key(key), user.pk, settings.PRINCIPAL_CACHE_TIMEOUT)
+            cache.set(principal_key(user.pk), user, settings.PRINCIPAL_CACHE_TIMEOUT)
+            return user, token
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, Token(key=key, user=user)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def forget_principal(sender, instance, **kwargs):
+    # Logins too, views save request.user as a whole and would write back a stale last_login.
+    cache.delete(principal_key(instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    # Logging out deletes the token, it has to stop working right away.
+    cache.delete(token_key(instance.key))
@@ -1,6 +1,8 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 
+from .authentication import get_cached_user
+
 
 class CustomAuthBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
@@ -13,8 +15,5 @@ class CustomAuthBackend(ModelBackend):
             return None
 
     def get_user(self, user_id):
-        UserModel = get_user_model()
-        try:
-            return UserModel.objects.get(pk=user_id)
-        except UserModel.DoesNotExist:
-            return None
+        # Session requests resolve their user here, the principal cache spares them the query.
+        return get_cached_user(user_id)
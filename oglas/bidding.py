@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Auction, Bid
+from .realtime import publish_bid
+
+
+class BidRejected(Exception):
+    def __init__(self, message, current_price=None):
+        super().__init__(message)
+        self.message = message
+        self.current_price = current_price
+
+
+def place_bid(auction_id, bidder, amount):
+    """
+    Records ``amount`` as the new highest bid of the auction or raises BidRejected.
+
+    Competing bids are serialized by a conditional UPDATE of the auction row: it only matches
+    while the auction is open and the amount beats current_price, and it keeps the row locked
+    until the transaction commits. A concurrent bid blocks on that lock and PostgreSQL
+    re-evaluates its WHERE clause against the committed row, so only increasing bids win and
+    none lands once close_auctions has closed the auction, even with end_time read earlier.
+    """
+    auction = Auction.objects.filter(id=auction_id).values('current_price', 'starting_price', 'end_time',
+                                                           'is_closed', 'ad__owner_id').first()
+    if auction is None:
+        raise Auction.DoesNotExist
+    # Cheap unlocked checks first, most stale bids never reach the transaction.
+    if auction['ad__owner_id'] == bidder.id:
+        raise BidRejected('You cannot bid on your own auction.')
+    if auction['is_closed'] or auction['end_time'] <= timezone.now():
+        raise BidRejected('The auction has ended.')
+    if amount < auction['starting_price'] or amount <= auction['current_price']:
+        raise BidRejected('The bid must be higher than the current price.', auction['current_price'])
+
+    with transaction.atomic():
+        won = Auction.objects.filter(
+            id=auction_id, is_closed=False, end_time__gt=timezone.now(), starting_price__lte=amount,
+            current_price__lt=amount,
+        ).update(current_price=amount)
+        if not won:
+            current = Auction.objects.filter(id=auction_id).values('current_price', 'is_closed').first()
+            if current['is_closed']:
+                raise BidRejected('The auction has ended.')
+            raise BidRejected('The bid must be higher than the current price.', current['current_price'])
+
+        Bid.objects.filter(auction_id=auction_id, is_highest_bid=True).update(is_highest_bid=False)
+        bid = Bid.objects.create(auction_id=auction_id, bidder=bidder, bid_amount=amount, is_highest_bid=True)
+        transaction.on_commit(lambda: publish_bid(bid, amount))
+    return bid
@@ -0,0 +1,164 @@
+import codecs
+import csv
+import io
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .cache import ad_namespaces, bump_generations
+from .listings import refresh_listings
+from .models import Ad, CarAd, bulk_create_car_ads
+from .serializer import AdSerializer, CarAdSerializer
+
+IMPORT_CHUNK_SIZE = 500
+# Errors beyond this are only counted, so a file of garbage can't exhaust memory.
+IMPORT_MAX_ERRORS = 1000
+EXPORT_CHUNK_SIZE = 2000
+
+AD_COLUMNS = ['id', 'title', 'description', 'price', 'ad_type', 'location', 'address', 'category', 'image_urls',
+              'created_at', 'is_active']
+CAR_COLUMNS = ['manufacturer', 'year', 'mileage', 'fuel_type', 'color', 'car_type']
+EXPORT_COLUMNS = AD_COLUMNS + CAR_COLUMNS
+FILE_FORMATS = ('csv', 'jsonl')
+
+
+class InvalidRow:
+    def __init__(self, error):
+        self.error = error
+
+
+def get_file_format(name, requested=None):
+    file_format = requested or name.rsplit('.', 1)[-1].lower()
+    return file_format if file_format in FILE_FORMATS else None
+
+
+def read_rows(lines, file_format):
+    """
+    Yields one dict per CSV or JSONL record of ``lines``, an iterable of byte lines such as an
+    uploaded file. Records that can't be parsed are yielded as InvalidRow so numbering stays right.
+    CSV cells that are empty are left out and image_urls holds space separated URLs.
+    """
+    text = codecs.iterdecode(lines, 'utf-8-sig')
+    if file_format == 'csv':
+        for row in csv.DictReader(text):
+            row = {key: value for key, value in row.items() if key and value not in ('', None)}
+            if 'image_urls' in row:
+                row['image_urls'] = row['image_urls'].split()
+            yield row
+        return
+
+    for line in text:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield InvalidRow(f'Invalid JSON: {e}')
+            continue
+        yield row if isinstance(row, dict) else InvalidRow('Expected a JSON object.')
+
+
+def build_ad(row, owner):
+    """Validates ``row`` with the ad serializers and returns (ad, errors), ad is an unsaved Ad or CarAd."""
+    if isinstance(row, InvalidRow):
+        return None, {'non_field_errors': [row.error]}
+    if not row.get('category'):
+        return None, {'category': ['This field is required.']}
+
+    ad_serializer = AdSerializer(data=row)
+    car_serializer = CarAdSerializer(data=row) if row['category'] == 'car' else None
+    errors = {}
+    if not ad_serializer.is_valid():
+        errors.update(ad_serializer.errors)
+    if car_serializer is not None and not car_serializer.is_valid():
+        errors.update(car_serializer.errors)
+    if errors:
+        return None, errors
+
+    data = dict(ad_serializer.validated_data)
+    # Featuring is granted by the site, an import can't ask for it.
+    data.pop('is_featured', None)
+    if car_serializer is not None:
+        return CarAd(owner=owner, **data, **car_serializer.validated_data), None
+    return Ad(owner=owner, **data), None
+
+
+def import_ads(rows, owner, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Creates the valid ``rows`` as ads of ``owner``, validating and inserting them a chunk at a
+    time so memory stays flat. Each chunk is one transaction with two bulk inserts for plain ads
+    and three for cars, instead of one or two INSERTs per ad. Returns a summary of the import
+    with the errors of every rejected row, keyed by its 1-based record number.
+    """
+    summary = {'created': 0, 'failed': 0, 'errors': []}
+    numbered = enumerate(rows, 1)
+    while chunk := list(islice(numbered, chunk_size)):
+        ads, car_ads = [], []
+        for number, row in chunk:
+            ad, errors = build_ad(row, owner)
+            if errors:
+                summary['failed'] += 1
+                if len(summary['errors']) < IMPORT_MAX_ERRORS:
+                    summary['errors'].append({'row': number, 'errors': errors})
+            elif isinstance(ad, CarAd):
+                car_ads.append(ad)
+            else:
+                ads.append(ad)
+
+        with transaction.atomic():
+            Ad.objects.bulk_create(ads)
+            bulk_create_car_ads(car_ads)
+            refresh_listings(Ad.objects.filter(id__in=[ad.id for ad in ads + car_ads]))
+        summary['created'] += len(ads) + len(car_ads)
+
+        # Bulk inserts send no post_save, so the read model is refreshed and the cache invalidated here.
+        categories = {ad.category for ad in ads + car_ads}
+        bump_generations([namespace for category in categories for namespace in ad_namespaces(category, False)])
+    return summary
+
+
+def export_rows(queryset):
+    """Yields the export columns of every ad in ``queryset`` as dicts, reading it in chunks."""
+    car_lookups = [f'carad__{column}' for column in CAR_COLUMNS]
+    rows = queryset.order_by('id').values_list(*AD_COLUMNS, *car_lookups).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for values in rows:
+        yield dict(zip(EXPORT_COLUMNS, values))
+
+
+def export_chunks(queryset, file_format):
+    """Yields the ads of ``queryset`` encoded as CSV or JSONL, one string per EXPORT_CHUNK_SIZE ads."""
+    rows = export_rows(queryset)
+    buffer = io.StringIO()
+    if file_format == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+        writer.writeheader()
+    while chunk := list(islice(rows, EXPORT_CHUNK_SIZE)):
+        for row in chunk:
+            if file_format == 'csv':
+                writer.writerow({**row, 'image_urls': ' '.join(url for url in row['image_urls'] if url)})
+            else:
+                # Left out like empty CSV cells, the serializers reject null and an empty image list.
+                row = {key: value for key, value in row.items() if value is not None and value != []}
+                buffer.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if file_format == 'csv' and buffer.tell():
+        yield buffer.getvalue()
+
+
+async def iterate_in_thread(iterator):
+    # Under ASGI a sync iterator would be read into a list before sending, pull it chunk by chunk instead.
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(iterator, None)) is not None:
+        yield chunk
+
+
+def streaming_content(request, iterator):
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        return iterate_in_thread(iterator)
+    return iterator
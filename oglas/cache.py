@@ -0,0 +1,181 @@
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.core.cache import caches
+from django.db.models.signals import post_init
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Ad, CarAd, CustomUser
+from .serializer import USER_INFO_FIELDS
+
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = 60 * 5
+
+# Cached ad payloads embed the owner block, so every ad response depends on this namespace.
+USERS_NAMESPACE = 'users'
+SIMILAR_NAMESPACE = 'similar'
+FEATURED_NAMESPACE = 'featured'
+
+cached_views = set()
+
+
+def get_response_cache():
+    return caches[RESPONSE_CACHE_ALIAS]
+
+
+def get_generations(namespaces):
+    """
+    Every namespace has a generation counter that is part of the cache key. Bumping the counter
+    invalidates every response cached under the namespace without having to find the keys.
+    """
+    cache = get_response_cache()
+    keys = [f'generation:{namespace}' for namespace in namespaces]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Start from the clock so an evicted counter never comes back with an old value.
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generations(namespaces):
+    cache = get_response_cache()
+    for namespace in set(namespaces):
+        key = f'generation:{namespace}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def get_cache_key(name, request, namespaces, view_kwargs):
+    params = sorted((key, value) for key, values in request.GET.lists() for value in values if value)
+    params += sorted(view_kwargs.items())
+    generations = ':'.join(str(generation) for generation in get_generations(namespaces))
+    digest = hashlib.md5(urlencode(params).encode('utf-8')).hexdigest()
+    return f'response:{name}:{generations}:{digest}'
+
+
+def record(name, outcome):
+    cache = get_response_cache()
+    key = f'stats:{name}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def get_cache_stats():
+    cache = get_response_cache()
+    keys = [f'stats:{name}:{outcome}' for name in sorted(cached_views) for outcome in ('hits', 'misses')]
+    counters = cache.get_many(keys)
+    return {
+        name: {outcome: counters.get(f'stats:{name}:{outcome}', 0) for outcome in ('hits', 'misses')}
+        for name in sorted(cached_views)
+    }
+
+
+def cache_response(name, namespaces=None):
+    """
+    Caches the data of successful responses of a public read view. ``namespaces`` receives the
+    request and the view kwargs and returns the invalidation namespaces the response depends on.
+    Works on APIView handlers and on @api_view functions.
+    """
+    cached_views.add(name)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            request = args[1] if len(args) > 1 else args[0]
+            key, data = lookup_response(name, namespaces, request, kwargs)
+            if data is not None:
+                return Response(data, status=status.HTTP_200_OK)
+
+            response = func(*args, **kwargs)
+            store_response(key, response)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def lookup_response(name, namespaces, request, view_kwargs):
+    """Returns the cache key of the request and the cached data, None on a miss."""
+    view_namespaces = namespaces(request, **view_kwargs) if namespaces else []
+    key = get_cache_key(name, request, view_namespaces, view_kwargs)
+    data = get_response_cache().get(key)
+    record(name, 'misses' if data is None else 'hits')
+    return key, data
+
+
+def store_response(key, response):
+    if response.status_code == status.HTTP_200_OK:
+        get_response_cache().set(key, response.data, RESPONSE_CACHE_TIMEOUT)
+
+
+def ad_list_namespaces(request, **kwargs):
+    category = request.GET.get('category')
+    if category and category != 'All':
+        return [USERS_NAMESPACE, f'ads:{category}']
+    return [USERS_NAMESPACE, 'ads:all']
+
+
+def similar_ads_namespaces(request, **kwargs):
+    # The category of the ad isn't known without a query, so any ad change invalidates these, as
+    # does every run of compute_similar_ads.
+    return [USERS_NAMESPACE, 'ads:all', SIMILAR_NAMESPACE]
+
+
+def ad_namespaces(category, is_featured):
+    namespaces = ['ads:all', f'ads:{category}']
+    if is_featured:
+        namespaces.append(FEATURED_NAMESPACE)
+    return namespaces
+
+
+@receiver(post_init, sender=Ad)
+@receiver(post_init, sender=CarAd)
+def remember_cached_state(sender, instance, **kwargs):
+    # Read through __dict__ so deferred fields are never loaded just for this.
+    instance._cached_state = (instance.__dict__.get('category'), instance.__dict__.get('is_featured'))
+
+
+@receiver(post_init, sender=CustomUser)
+def remember_owner_state(sender, instance, **kwargs):
+    instance._owner_state = get_owner_state(instance)
+
+
+def get_owner_state(user):
+    # The fields ad payloads show of their owner, read like in remember_cached_state().
+    return tuple(user.__dict__.get(name) for name in USER_INFO_FIELDS)
+
+
+def owner_changed(user, created=False, update_fields=None):
+    """Whether saving ``user`` changed the owner block of their ads."""
+    # New users own no ads yet. Logins, passwords and verification flags aren't shown in an ad.
+    if created or (update_fields is not None and not set(update_fields) & set(USER_INFO_FIELDS)):
+        return False
+    return get_owner_state(user) != user._owner_state
+
+
+# The two invalidation receivers below are called by oglas.listings once the listings are written,
+# a response rebuilt any earlier could still be made from the old listings.
+def invalidate_ad_responses(sender, instance, **kwargs):
+    # Both the state the ad was loaded with and its new state can be visible in cached pages.
+    category, is_featured = instance._cached_state
+    bump_generations(ad_namespaces(category, is_featured) + ad_namespaces(instance.category, instance.is_featured))
+    instance._cached_state = (instance.category, instance.is_featured)
+
+
+def invalidate_owner_responses(sender, instance, created=False, update_fields=None, **kwargs):
+    changed = owner_changed(instance, created, update_fields)
+    # Created users get their id only now.
+    instance._owner_state = get_owner_state(instance)
+    if changed:
+        bump_generations([USERS_NAMESPACE])
@@ -0,0 +1,74 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max, Sum
+from django.views.decorators.http import condition
+
+from .cache import USERS_NAMESPACE, ad_list_namespaces, get_cache_key, get_generations
+from .models import Ad, CarAd, Wishlist
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def etag(etag_func):
+    """
+    Emits ``etag_func`` as a strong ETag and answers a matching If-None-Match with a 304 before
+    the view runs. The ETag functions only touch version counters, never the serialized payload.
+    """
+    return condition(etag_func=etag_func)
+
+
+def async_etag(etag_func):
+    """etag() for async views. ``etag_func`` may query, so it runs in the request's sync thread."""
+
+    def decorator(func):
+        @wraps(func)
+        async def inner(request, *args, **kwargs):
+            value = await sync_to_async(etag_func)(request, *args, **kwargs)
+            return await condition(etag_func=lambda *a, **kw: value)(func)(request, *args, **kwargs)
+
+        return inner
+
+    return decorator
+
+
+def ad_list_etag(request, **kwargs):
+    # Listings change whenever the cache generations they depend on are bumped.
+    return make_etag(get_cache_key('ad-list', request, ad_list_namespaces(request), kwargs))
+
+
+def ad_facets_etag(request, **kwargs):
+    # Counts change with the same generations as the listings they count.
+    return make_etag(get_cache_key('ad-facets', request, ad_list_namespaces(request), kwargs))
+
+
+def ad_details_etag(request, id):
+    version = Ad.objects.filter(id=id).values_list('version', flat=True).first()
+    if version is None:
+        return None
+    return make_etag(id, version, get_generations([USERS_NAMESPACE]))
+
+
+def wishlist_etag(request):
+    # Adding or removing an item moves the count or the newest id, versions only grow so an edit of
+    # any wishlisted ad moves their sum. Every page and projection of the wishlist has its own tag.
+    state = Wishlist.objects.filter(user=request.user).aggregate(
+        count=Count('id'), last_id=Max('id'), versions=Sum('ad__version'))
+    return make_etag(state, get_generations([USERS_NAMESPACE]), sorted(request.GET.lists()))
+
+
+def user_info_etag(request):
+    user = request.user
+    return make_etag(user.id, user.username, user.first_name, user.last_name, user.email,
+                     user.phone_number, user.date_of_birth, user.role)
+
+
+CHOICES_ETAG = make_etag(Ad.CITY_CHOICES, Ad.AD_TYPES, Ad.CATEGORY_CHOICES, CarAd.MANUFACTURER_CHOICES,
+                         CarAd.FUEL_CHOICES, CarAd.COLOR_CHOICES, CarAd.CAR_TYPE_CHOICES)
+
+
+def choices_etag(request):
+    return CHOICES_ETAG
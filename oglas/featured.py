@@ -0,0 +1,71 @@
+import random
+
+from .cache import FEATURED_NAMESPACE, RESPONSE_CACHE_TIMEOUT, USERS_NAMESPACE, cached_views, get_generations, \
+    get_response_cache, record
+from .models import AdListing
+
+FEATURED_ADS_COUNT = 4
+SLATE_POSITION_KEY = 'featured:position'
+
+cached_views.add('featured-slate')
+
+# The slate of the last generations seen by this process, saves unpickling it on every request.
+_local_slate = (None, [])
+
+
+def build_slate(generations):
+    """
+    The payloads of every featured, active ad in rotation order. The order is shuffled once per
+    generation, the same way in every process, so new featured ads aren't always shown last.
+    """
+    listings = AdListing.objects.filter(is_featured=True, is_active=True).order_by('id')
+    slate = list(listings.values_list('payload', flat=True))
+    random.Random(':'.join(str(generation) for generation in generations)).shuffle(slate)
+    return slate
+
+
+def get_slate():
+    """
+    The current slate from this process, the response cache or, once per change of a featured ad
+    or an owner, the database. The namespaces are bumped by the same signals as the cached responses.
+    """
+    global _local_slate
+    generations = tuple(get_generations([USERS_NAMESPACE, FEATURED_NAMESPACE]))
+    if _local_slate[0] == generations:
+        return _local_slate[1]
+
+    cache = get_response_cache()
+    key = 'featured:slate:' + ':'.join(str(generation) for generation in generations)
+    slate = cache.get(key)
+    record('featured-slate', 'misses' if slate is None else 'hits')
+    if slate is None:
+        slate = build_slate(generations)
+        cache.set(key, slate, RESPONSE_CACHE_TIMEOUT)
+    _local_slate = (generations, slate)
+    return slate
+
+
+def next_position():
+    # Shared by every process, so consecutive requests see consecutive slices wherever they land.
+    cache = get_response_cache()
+    try:
+        return cache.incr(SLATE_POSITION_KEY)
+    except ValueError:
+        cache.add(SLATE_POSITION_KEY, 0, timeout=None)
+    try:
+        return cache.incr(SLATE_POSITION_KEY)
+    except ValueError:
+        # Evicted again, or a cache that keeps nothing, start anywhere in the slate.
+        return random.randrange(FEATURED_ADS_COUNT * 1000)
+
+
+def get_featured_ads(count=FEATURED_ADS_COUNT):
+    """
+    The next ``count`` ads of the slate. Requests walk the slate in turn and wrap around, so every
+    featured ad gets the same share of the homepage. Takes no queries while the slate is cached.
+    """
+    slate = get_slate()
+    if len(slate) <= count:
+        return slate
+    start = next_position() * count % len(slate)
+    return slate[start:start + count] + slate[:max(0, start + count - len(slate))]
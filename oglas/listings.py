@@ -0,0 +1,73 @@
+from itertools import islice
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_ad_responses, invalidate_owner_responses, owner_changed
+from .models import Ad, AdListing, CarAd, CustomUser
+from .serializer import AdSerializer
+
+LISTING_CHUNK_SIZE = 1000
+AD_FIELDS = ['category', 'location', 'ad_type', 'price', 'created_at', 'is_active', 'is_featured']
+CAR_FIELDS = ['manufacturer', 'year', 'mileage', 'fuel_type', 'color', 'car_type']
+
+
+def build_listing(ad):
+    try:
+        car_ad = ad.carad
+    except CarAd.DoesNotExist:
+        car_ad = None
+    return AdListing(
+        id=ad.id,
+        owner_id=ad.owner_id,
+        payload=AdSerializer(ad).data,
+        similar_stale=True,
+        **{name: getattr(ad, name) for name in AD_FIELDS},
+        **{name: getattr(car_ad, name, None) for name in CAR_FIELDS},
+    )
+
+
+def refresh_listings(ads):
+    """
+    Rewrites the AdListing rows of the ``ads`` queryset from the ads themselves. Has to be called
+    after writes that send no signals: bulk_create(), bulk_create_car_ads() and QuerySet.update().
+    """
+    ads = AdSerializer.setup_eager_loading(ads).order_by('id').iterator(chunk_size=LISTING_CHUNK_SIZE)
+    while chunk := list(islice(ads, LISTING_CHUNK_SIZE)):
+        AdListing.objects.bulk_create(
+            [build_listing(ad) for ad in chunk],
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=['owner', 'payload', 'similar_stale', *AD_FIELDS, *CAR_FIELDS],
+        )
+
+
+def rebuild_listings(chunk_size=LISTING_CHUNK_SIZE):
+    """Rewrites the whole read model a chunk of ads at a time and drops rows of deleted ads."""
+    ids = Ad.objects.order_by('id').values_list('id', flat=True)
+    last_id = 0
+    while chunk := list(ids.filter(id__gt=last_id)[:chunk_size]):
+        refresh_listings(Ad.objects.filter(id__in=chunk))
+        last_id = chunk[-1]
+    AdListing.objects.exclude(id__in=Ad.objects.values('id')).delete()
+
+
+@receiver(post_save, sender=Ad)
+@receiver(post_save, sender=CarAd)
+def refresh_ad_listing(sender, instance, **kwargs):
+    refresh_listings(Ad.objects.filter(id=instance.id))
+    invalidate_ad_responses(sender, instance, **kwargs)
+
+
+@receiver(post_delete, sender=Ad)
+def delete_ad_listing(sender, instance, **kwargs):
+    AdListing.objects.filter(id=instance.id).delete()
+    invalidate_ad_responses(sender, instance, **kwargs)
+
+
+@receiver(post_save, sender=CustomUser)
+def refresh_owner_listings(sender, instance, created=False, update_fields=None, **kwargs):
+    # Every listing embeds its owner, saves that leave the owner block alone don't concern them.
+    if owner_changed(instance, created, update_fields):
+        refresh_listings(Ad.objects.filter(owner=instance))
+    invalidate_owner_responses(sender, instance, created, update_fields)
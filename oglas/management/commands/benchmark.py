@@ -0,0 +1,381 @@
+import asyncio
+import io
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.contrib.auth.hashers import make_password
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings, setup_databases, setup_test_environment, \
+    teardown_databases, teardown_test_environment
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from oglas.cache import get_response_cache
+from oglas.listings import rebuild_listings
+from oglas.models import CustomUser, Ad, AdListing, CarAd, Wishlist, Auction, Bid, bulk_create_car_ads
+from oglas.renderers import FastJSONRenderer
+from oglas.serializer import AdRowSerializer, AdSerializer
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway test database and measures latency, queries per request and throughput '
+            'of the public ad browsing endpoints. Prints JSON so runs can be diffed between releases.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--ads', type=int, default=5000)
+        parser.add_argument('--car-ads', type=int, default=2000)
+        parser.add_argument('--wishlist', type=int, default=2000, help='Wishlist rows spread over the users.')
+        parser.add_argument('--auctions', type=int, default=200)
+        parser.add_argument('--bids', type=int, default=2000)
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--scenario', action='append', help='Only run these scenarios, may be repeated.')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the response cache between requests instead of measuring cold requests.')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the seeded test database between runs.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--concurrency', type=int, default=0,
+                            help='Also compare WSGI and ASGI throughput with this many concurrent connections.')
+        parser.add_argument('--rendering-rounds', type=int, default=20,
+                            help='Measured rounds of the serialize and render comparison, 0 skips it.')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.failed = []
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            if not Ad.objects.exists():
+                self.seed(options)
+            report = {
+                'database': connection.vendor,
+                'volumes': {name: options[name] for name in ('users', 'ads', 'car_ads', 'wishlist', 'auctions', 'bids')},
+                'seed': options['seed'],
+                'warm_cache': options['warm_cache'],
+                'scenarios': self.run_scenarios(options),
+            }
+            if options['rendering_rounds']:
+                report['rendering'] = self.compare_rendering(options)
+            if options['concurrency']:
+                report['concurrency'] = options['concurrency']
+                report['handlers'] = self.compare_handlers(options)
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if self.failed:
+            raise CommandError(f'Requests failed in {", ".join(self.failed)}, their timings are left out.')
+
+    def seed(self, options):
+        rnd = self.random
+        cities = [city for city, _ in Ad.CITY_CHOICES[1:]]
+        categories = [category for category, _ in Ad.CATEGORY_CHOICES[1:] if category != 'car']
+        password = make_password('benchmark')
+
+        users = CustomUser.objects.bulk_create([
+            CustomUser(email=f'user{i}@benchmark.mk', username=f'user{i}', first_name='Bench', last_name=f'User {i}',
+                       password=password, is_verified=True)
+            for i in range(options['users'])
+        ], batch_size=1000)
+
+        def ad_fields(i):
+            return {
+                'title': f'{rnd.choice(["Selling", "Renting", "Offer", "Bargain"])} {i}',
+                'description': 'Benchmark listing ' * rnd.randint(5, 50),
+                'price': Decimal(rnd.randint(10, 100000)),
+                'ad_type': rnd.choice(['sale', 'rent']),
+                'location': rnd.choice(cities),
+                'image_urls': [f'https://example.com/o/images%2F{i}-{n}.jpg?alt=media' for n in range(rnd.randint(0, 8))],
+                'owner': rnd.choice(users),
+                'is_featured': rnd.random() < 0.02,
+            }
+
+        Ad.objects.bulk_create([
+            Ad(category=rnd.choice(categories), **ad_fields(i)) for i in range(options['ads'])
+        ], batch_size=1000)
+        bulk_create_car_ads([
+            CarAd(category='car', manufacturer=rnd.choice(CarAd.MANUFACTURER_CHOICES[1:])[0],
+                  year=rnd.randint(1990, 2024), mileage=rnd.randint(0, 400000),
+                  fuel_type=rnd.choice(CarAd.FUEL_CHOICES[1:])[0], color=rnd.choice(CarAd.COLOR_CHOICES[1:])[0],
+                  car_type=rnd.choice(CarAd.CAR_TYPE_CHOICES[1:])[0], **ad_fields(options['ads'] + i))
+            for i in range(options['car_ads'])
+        ], batch_size=1000)
+
+        # created_at is auto_now_add, spread it over the last year afterwards.
+        ids = list(Ad.objects.values_list('id', flat=True))
+        today = timezone.now().date()
+        for day in range(365):
+            Ad.objects.filter(id__in=ids[day::365]).update(created_at=today - timedelta(days=day))
+
+        pairs = {(rnd.choice(users).id, rnd.choice(ids)) for _ in range(options['wishlist'])}
+        Wishlist.objects.bulk_create([Wishlist(user_id=user_id, ad_id=ad_id) for user_id, ad_id in pairs],
+                                     batch_size=1000)
+
+        auctions = Auction.objects.bulk_create([
+            Auction(ad_id=ad_id, starting_price=Decimal(100), current_price=Decimal(100),
+                    end_time=timezone.now() + timedelta(days=rnd.randint(-5, 30)))
+            for ad_id in rnd.sample(ids, min(options['auctions'], len(ids)))
+        ], batch_size=1000)
+        if auctions:
+            Bid.objects.bulk_create([
+                Bid(auction=rnd.choice(auctions), bidder=rnd.choice(users), bid_amount=Decimal(100 + i))
+                for i in range(options['bids'])
+            ], batch_size=1000)
+
+        # Everything above bypassed the signals that maintain the read model.
+        rebuild_listings()
+
+    def get_scenarios(self):
+        rnd = self.random
+        ids = list(Ad.objects.values_list('id', flat=True))
+        wishlist_user = CustomUser.objects.filter(wishlist__isnull=False).first()
+        cities = [city for city, _ in Ad.CITY_CHOICES[1:]]
+        manufacturers = [manufacturer for manufacturer, _ in CarAd.MANUFACTURER_CHOICES[1:]]
+
+        return {
+            'ads': lambda: ('/ads/', {}),
+            'ads_newest': lambda: ('/ads/', {'sort': 'newest', 'page': rnd.randint(1, 20)}),
+            'ads_price_sort': lambda: ('/ads/', {'sort': rnd.choice(['priceLowToHigh', 'priceHighToLow'])}),
+            'ads_location': lambda: ('/ads/', {'location': rnd.choice(cities), 'sort': 'newest'}),
+            'ads_price_range': lambda: ('/ads/', {'priceFrom': 1000, 'priceTo': rnd.randint(2000, 50000)}),
+            'ads_car_filters': lambda: ('/ads/', {'category': 'car', 'manufacturer': rnd.choice(manufacturers),
+                                                  'yearFrom': rnd.randint(1995, 2020), 'sort': 'newest'}),
+            'ads_search': lambda: ('/ads/', {'search': rnd.choice(['Selling', 'Offer 12', 'Bargain'])}),
+            'ads_cursor': lambda: ('/ads/', {'pagination': 'cursor', 'sort': 'newest'}),
+            'ads_large_page': lambda: ('/ads/', {'size': 1000}),
+            'ad_details': lambda: (f'/ad/{rnd.choice(ids)}/', {}),
+            'featured': lambda: ('/ads/featured/', {}),
+            'similar': lambda: (f'/ads/similar/{rnd.choice(ids)}/', {}),
+            'wishlist': lambda: ('/wishlist/', {'_user': wishlist_user}),
+        }
+
+    def run_scenarios(self, options):
+        cache = get_response_cache()
+        results = {}
+        for name, make_request in self.get_scenarios().items():
+            if options['scenario'] and name not in options['scenario']:
+                continue
+            client = APIClient()
+            latencies, queries, statuses = [], [], {}
+            for i in range(options['warmup'] + options['requests']):
+                path, params = make_request()
+                client.force_authenticate(params.pop('_user', None))
+                if not options['warm_cache']:
+                    cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.get(path, params)
+                    elapsed = time.perf_counter() - start
+                if i < options['warmup']:
+                    continue
+                latencies.append(elapsed)
+                queries.append(len(captured.captured_queries))
+                statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            results[name] = self.summarize(latencies, queries, statuses)
+            if not self.check_statuses(name, results[name]):
+                self.stderr.write(f'{name}: p50 {results[name]["p50_ms"]} ms, {results[name]["queries_per_request"]} queries')
+        return results
+
+    def compare_rendering(self, options):
+        """
+        Time to serialize and render 1000 ads to JSON, rows loaded beforehand. ``before`` is what the
+        lists used to do: AdSerializer on model instances and JSONRenderer, ``after`` is what they do
+        now: AdRowSerializer on .values() rows, or the stored AdListing payloads, and FastJSONRenderer.
+        """
+        ads = {'ads': Ad.objects.exclude(category='car').order_by('-id'), 'car_ads': CarAd.objects.order_by('-id')}
+        results = {}
+        for name, queryset in ads.items():
+            instances = list(AdSerializer.setup_eager_loading(queryset)[:1000])
+            rows = list(AdRowSerializer().setup_sparse_loading(queryset)[:1000])
+            results[name] = self.time_rendering(
+                lambda: JSONRenderer().render(AdSerializer(instances, many=True).data),
+                lambda: FastJSONRenderer().render(AdRowSerializer(rows, many=True).data),
+                len(rows), options['rendering_rounds'],
+            )
+        payloads = list(AdListing.objects.order_by('-id').values_list('payload', flat=True)[:1000])
+        results['listings'] = self.time_rendering(
+            lambda: JSONRenderer().render(payloads), lambda: FastJSONRenderer().render(payloads),
+            len(payloads), options['rendering_rounds'],
+        )
+        for name, result in results.items():
+            self.stderr.write(f'{name}: {result["before_ms_per_1000"]} ms before, {result["after_ms_per_1000"]} ms after')
+        return results
+
+    def time_rendering(self, before, after, count, rounds):
+        if before() != after():
+            raise CommandError('The fast path renders different JSON.')
+        timings = {}
+        for name, render in (('before', before), ('after', after)):
+            samples = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                render()
+                samples.append(time.perf_counter() - start)
+            timings[name] = round(statistics.median(samples) * 1000 * 1000 / max(count, 1), 3)
+        return {
+            'ads': count,
+            'before_ms_per_1000': timings['before'],
+            'after_ms_per_1000': timings['after'],
+            'speedup': round(timings['before'] / timings['after'], 2) if timings['after'] else None,
+        }
+
+    def compare_handlers(self, options):
+        """
+        Replays every anonymous scenario through the real WSGI handler, with the sync views and one
+        thread per connection, and through the real ASGI handler, with the async views and one task
+        per connection. Throughput is requests over wall clock time with all connections busy.
+        """
+        # Cold requests can't be forced per request once they overlap, so the cache is switched off.
+        cache_settings = override_settings() if options['warm_cache'] else override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'responses': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        })
+        results = {}
+        for name, make_request in self.get_scenarios().items():
+            if options['scenario'] and name not in options['scenario']:
+                continue
+            requests = [make_request() for _ in range(options['requests'])]
+            if any('_user' in params for _, params in requests):
+                continue
+            with cache_settings:
+                with override_settings(ROOT_URLCONF='oglasBE.urls'):
+                    wsgi = self.run_wsgi(requests, options['concurrency'])
+                with override_settings(ROOT_URLCONF='oglasBE.asgi_urls'):
+                    asgi = asyncio.run(self.run_asgi(requests, options['concurrency']))
+            results[name] = {'wsgi': wsgi, 'asgi': asgi}
+            if not self.check_statuses(f'{name} (wsgi)', wsgi) + self.check_statuses(f'{name} (asgi)', asgi):
+                self.stderr.write(f'{name}: wsgi {wsgi["throughput_rps"]} rps, asgi {asgi["throughput_rps"]} rps')
+        return results
+
+    def run_wsgi(self, requests, concurrency):
+        handler = WSGIHandler()
+        pending = iter(requests)
+        lock = threading.Lock()
+        latencies, statuses = [], {}
+
+        def start_response(status, headers):
+            with lock:
+                statuses[status[:3]] = statuses.get(status[:3], 0) + 1
+
+        def connection_worker():
+            try:
+                while True:
+                    with lock:
+                        request = next(pending, None)
+                    if request is None:
+                        return
+                    path, params = request
+                    start = time.perf_counter()
+                    response = handler(self.wsgi_environ(path, params), start_response)
+                    b''.join(response)
+                    response.close()
+                    with lock:
+                        latencies.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=connection_worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.summarize(latencies, None, statuses, elapsed=time.perf_counter() - start)
+
+    def wsgi_environ(self, path, params):
+        return {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': urlencode(params),
+            'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'testserver', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'http', 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+        }
+
+    async def run_asgi(self, requests, concurrency):
+        handler = ASGIHandler()
+        pending = iter(requests)
+        latencies, statuses = [], {}
+
+        async def connection_worker():
+            for path, params in pending:
+                start = time.perf_counter()
+                status = await self.asgi_get(handler, path, params)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(connection_worker() for _ in range(concurrency)))
+        return self.summarize(latencies, None, statuses, elapsed=time.perf_counter() - start)
+
+    async def asgi_get(self, handler, path, params):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': urlencode(params).encode(),
+            'root_path': '', 'headers': [(b'host', b'testserver')], 'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        received = asyncio.Event()
+        status = None
+
+        async def receive():
+            if received.is_set():
+                # Nothing after the body until the handler stops listening for a disconnect.
+                await asyncio.Future()
+            received.set()
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = str(message['status'])
+
+        await handler(scope, receive, send)
+        return status
+
+    def summarize(self, latencies, queries, statuses, elapsed=None):
+        """Latency, throughput and query figures, left out when any request failed."""
+        failed = sum(count for status, count in statuses.items() if not (status.startswith('2') or status == '304'))
+        if failed:
+            return {'requests': len(latencies), 'statuses': statuses, 'failed': failed}
+
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 \
+            else latencies * 99
+        summary = {
+            'requests': len(latencies),
+            'statuses': statuses,
+            'failed': 0,
+            'p50_ms': round(percentiles[49] * 1000, 3),
+            'p95_ms': round(percentiles[94] * 1000, 3),
+            'p99_ms': round(percentiles[98] * 1000, 3),
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+            'throughput_rps': round(len(latencies) / (elapsed or sum(latencies)), 1),
+        }
+        if queries is not None:
+            summary['queries_per_request'] = round(statistics.fmean(queries), 2)
+            summary['max_queries'] = max(queries)
+        return summary
+
+    def check_statuses(self, name, summary):
+        if summary['failed']:
+            self.failed.append(name)
+            self.stderr.write(self.style.ERROR(
+                f'{name}: {summary["failed"]} of {summary["requests"]} requests failed {summary["statuses"]}'))
+        return summary['failed']
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from oglas.models import Auction, Bid
+from oglas.realtime import publish_closed
+
+
+class Command(BaseCommand):
+    help = 'Closes expired auctions in batches and records the highest bidder as the winner.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when done.')
+        parser.add_argument('--interval', type=float, default=10.0, help='Seconds to sleep when nothing expired.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            closed = self.close_batch(options['batch_size'])
+            total += closed
+            if closed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(f'Closed {total} auctions')
+
+    def close_batch(self, batch_size):
+        """
+        Claims a batch of expired auctions with SKIP LOCKED, so several workers can run at once
+        and an auction still locked by an in-flight bid is simply picked up by the next batch.
+        Winners are written by one UPDATE with a correlated subquery over the Bid index.
+        """
+        with transaction.atomic():
+            ids = list(
+                Auction.objects
+                .select_for_update(skip_locked=True)
+                .filter(is_closed=False, end_time__lte=timezone.now())
+                .order_by('end_time')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return 0
+            highest_bidder = Bid.objects.filter(auction=OuterRef('pk')).order_by('-bid_amount', 'bid_time')
+            closed = Auction.objects.filter(id__in=ids).update(
+                is_closed=True,
+                winner_id=Subquery(highest_bidder.values('bidder_id')[:1]),
+            )
+            transaction.on_commit(lambda: publish_closed(ids))
+        return closed
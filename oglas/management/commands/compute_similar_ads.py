@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from oglas.models import AdListing
+from oglas.similarity import SIMILAR_ADS_STORED, compute_similar_ads
+
+
+class Command(BaseCommand):
+    help = ('Precomputes the similar ads of every listing written to since the last run, or of all of them. '
+            'Needs NumPy.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every listing, so older lists pick up newer ads. Run it nightly.')
+        parser.add_argument('--count', type=int, default=SIMILAR_ADS_STORED, help='Similar ads kept per listing.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when done.')
+        parser.add_argument('--interval', type=float, default=30.0, help='Seconds to sleep when nothing changed.')
+
+    def handle(self, *args, **options):
+        listings = AdListing.objects.all() if options['all'] else AdListing.objects.filter(similar_stale=True)
+        total = 0
+        while True:
+            updated = compute_similar_ads(listings, options['count'])
+            total += updated
+            if options['all'] or not options['loop']:
+                break
+            if not updated:
+                time.sleep(options['interval'])
+        self.stdout.write(f'Computed similar ads of {total} listings')
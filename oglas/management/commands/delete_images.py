@@ -0,0 +1,78 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from oglas.models import PendingImageDeletion
+from oglas.storage import get_storage_client
+
+
+class Command(BaseCommand):
+    help = 'Deletes the storage blobs of deleted ads queued in PendingImageDeletion.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--max-attempts', type=int, default=8,
+                            help='Blobs failing this many times are left in the table for inspection.')
+        parser.add_argument('--lease', type=int, default=300,
+                            help='Seconds a claimed batch stays hidden from other workers.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when drained.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when the outbox is empty.')
+
+    def handle(self, *args, **options):
+        client = get_storage_client()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            while True:
+                batch = self.claim_batch(options['batch_size'], options['max_attempts'], options['lease'])
+                if batch:
+                    self.process_batch(executor, client, batch)
+                elif options['loop']:
+                    time.sleep(options['interval'])
+                else:
+                    break
+
+    def claim_batch(self, batch_size, max_attempts, lease):
+        # Claiming is a short transaction that pushes next_attempt_at out by the lease, so the
+        # network calls happen without holding row locks and a crashed worker's batch reappears.
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                PendingImageDeletion.objects
+                .select_for_update(skip_locked=True)
+                .filter(next_attempt_at__lte=now, attempts__lt=max_attempts)
+                .order_by('next_attempt_at')[:batch_size]
+            )
+            PendingImageDeletion.objects.filter(id__in=[item.id for item in batch]) \
+                .update(next_attempt_at=now + timedelta(seconds=lease))
+        return batch
+
+    def process_batch(self, executor, client, batch):
+        def delete(item):
+            try:
+                client.delete(item.blob_name)
+                return None
+            except Exception as e:
+                return e
+
+        errors = list(executor.map(delete, batch))
+        deleted = [item.id for item, error in zip(batch, errors) if error is None]
+        PendingImageDeletion.objects.filter(id__in=deleted).delete()
+
+        now = timezone.now()
+        for item, error in zip(batch, errors):
+            if error is None:
+                continue
+            backoff = min(2 ** item.attempts * 30, 60 * 60 * 6)
+            PendingImageDeletion.objects.filter(id=item.id).update(
+                attempts=F('attempts') + 1,
+                last_error=str(error),
+                next_attempt_at=now + timedelta(seconds=backoff),
+            )
+            self.stderr.write(f'Failed to delete image {item.blob_name}: {error}')
+
+        self.stdout.write(f'Deleted {len(deleted)} of {len(batch)} images')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from oglas.bulk import FILE_FORMATS, IMPORT_CHUNK_SIZE, get_file_format, import_ads, read_rows
+from oglas.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Imports ads from a CSV or JSONL file on behalf of a user, in validated bulk chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--owner', required=True, help='Email of the user the ads are created for.')
+        parser.add_argument('--format', dest='file_format', choices=FILE_FORMATS,
+                            help='Defaults to the extension of the file.')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            owner = CustomUser.objects.get(email=options['owner'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f'No user with email {options["owner"]}')
+        file_format = get_file_format(options['path'], options['file_format'])
+        if file_format is None:
+            raise CommandError('Pass --format for files without a .csv or .jsonl extension')
+
+        with open(options['path'], 'rb') as f:
+            summary = import_ads(read_rows(f, file_format), owner, options['chunk_size'])
+
+        for error in summary['errors']:
+            self.stderr.write(f'Row {error["row"]}: {error["errors"]}')
+        self.stdout.write(f'Created {summary["created"]} ads, {summary["failed"]} rows failed')
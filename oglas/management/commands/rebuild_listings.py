@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from oglas.listings import LISTING_CHUNK_SIZE, rebuild_listings
+from oglas.models import AdListing
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the AdListing read model from the ads, e.g. after migrating or after raw SQL updates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=LISTING_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        rebuild_listings(options['chunk_size'])
+        self.stdout.write(f'Rebuilt {AdListing.objects.count()} listings')
@@ -0,0 +1,77 @@
+import json
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from oglas.metrics import LATENCY_BUCKETS_MS, read_metrics, reset_metrics
+
+
+def estimate_percentile(counters, fraction):
+    # Upper bound of the histogram bucket the percentile falls into.
+    target = counters['requests'] * fraction
+    seen = 0
+    for bound in LATENCY_BUCKETS_MS:
+        seen += counters[f'bucket_{bound}']
+        if seen >= target:
+            return bound
+    return float('inf')
+
+
+class Command(BaseCommand):
+    help = 'Prints the slowest routes and the N+1 suspects recorded by RequestMetricsMiddleware.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', choices=['p95', 'mean', 'queries', 'db', 'serializer', 'bytes'], default='p95')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+        parser.add_argument('--reset', action='store_true', help='Clear the recorded metrics after printing them.')
+
+    def handle(self, *args, **options):
+        if isinstance(caches['default'], (LocMemCache, DummyCache)):
+            # The counters live in the cache of the processes serving requests, not in this one.
+            raise CommandError('The default cache is local to each process, so this command cannot see the '
+                               'counters of the web workers. Set REDIS_URL to share the cache between them.')
+        rows = []
+        for route, counters in read_metrics().items():
+            requests = counters['requests']
+            if not requests:
+                continue
+            rows.append({
+                'route': route,
+                'requests': requests,
+                'mean': counters['time_us'] / requests / 1000,
+                'p95': estimate_percentile(counters, 0.95),
+                'p99': estimate_percentile(counters, 0.99),
+                'queries': counters['queries'] / requests,
+                'db': counters['db_us'] / requests / 1000,
+                'serializer': counters['serializer_us'] / requests / 1000,
+                'bytes': counters['bytes'] / requests,
+                'n_plus_one': counters['n_plus_one'],
+                'n_plus_one_sample': counters['n_plus_one_sample'] or None,
+            })
+        rows.sort(key=lambda row: (row[options['sort']], row['mean']), reverse=True)
+        rows = rows[:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2, default=str))
+        else:
+            self.write_table(rows)
+
+        if options['reset']:
+            reset_metrics()
+
+    def write_table(self, rows):
+        self.stdout.write(f'{"route":<45} {"reqs":>7} {"mean ms":>8} {"p95 ms":>7} {"queries":>7} '
+                          f'{"db ms":>7} {"ser ms":>7} {"bytes":>9} {"n+1":>5}')
+        for row in rows:
+            self.stdout.write(f'{row["route"]:<45} {row["requests"]:>7} {row["mean"]:>8.1f} {row["p95"]:>7} '
+                              f'{row["queries"]:>7.1f} {row["db"]:>7.1f} {row["serializer"]:>7.1f} '
+                              f'{row["bytes"]:>9.0f} {row["n_plus_one"]:>5}')
+
+        suspects = [row for row in rows if row['n_plus_one']]
+        if suspects:
+            self.stdout.write('\nN+1 suspects:')
+            for row in suspects:
+                self.stdout.write(f'{row["route"]}: {row["n_plus_one"]} requests, e.g. {row["n_plus_one_sample"][:300]}')
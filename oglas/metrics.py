@@ -0,0 +1,222 @@
+import atexit
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils.crypto import constant_time_compare
+
+# Upper bounds of the latency histogram buckets in milliseconds, the last bucket is unbounded.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+COUNTERS = ('requests', 'time_us', 'queries', 'db_us', 'serializer_us', 'bytes', 'n_plus_one') + tuple(
+    f'bucket_{bound}' for bound in LATENCY_BUCKETS_MS + ('inf',))
+ROUTES_KEY = 'metrics:routes'
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook, wraps every query of the request.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated_statement(self):
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+class InstrumentedSerializerMixin:
+    """
+    Adds the time spent in to_representation() to the current request's metrics. Only the
+    outermost serializer is timed, and queries it triggers are counted as DB time instead.
+    """
+
+    def to_representation(self, instance):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.serializer_depth:
+            return super().to_representation(instance)
+
+        metrics.serializer_depth += 1
+        db_time = metrics.db_time
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_depth -= 1
+            metrics.serializer_time += time.perf_counter() - start - (metrics.db_time - db_time)
+
+
+class MetricsAggregator:
+    """
+    Per process counters that are flushed into the shared cache every few seconds, so recording
+    a request only costs a few dict updates.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(Counter)
+        self.samples = {}
+        self.last_flush = time.monotonic()
+
+    def record(self, route, elapsed, metrics, size):
+        elapsed_ms = elapsed * 1000
+        bucket = next((bound for bound in LATENCY_BUCKETS_MS if elapsed_ms <= bound), 'inf')
+        statement, repeats = metrics.repeated_statement()
+
+        with self.lock:
+            counters = self.counters[route]
+            counters['requests'] += 1
+            counters['time_us'] += int(elapsed * 1e6)
+            counters['queries'] += metrics.queries
+            counters['db_us'] += int(metrics.db_time * 1e6)
+            counters['serializer_us'] += int(metrics.serializer_time * 1e6)
+            counters['bytes'] += size
+            counters[f'bucket_{bucket}'] += 1
+            if repeats >= settings.REQUEST_METRICS_N_PLUS_ONE_THRESHOLD:
+                counters['n_plus_one'] += 1
+                self.samples[route] = f'{repeats}x {statement}'
+
+            # The caller flushes, so async requests can do it off the event loop.
+            return time.monotonic() - self.last_flush >= settings.REQUEST_METRICS_FLUSH_INTERVAL
+
+    def flush(self):
+        with self.lock:
+            counters, samples = self.counters, self.samples
+            self.counters, self.samples = defaultdict(Counter), {}
+            self.last_flush = time.monotonic()
+
+        routes = set(cache.get(ROUTES_KEY, ()))
+        if not routes.issuperset(counters):
+            cache.set(ROUTES_KEY, sorted(routes.union(counters)), timeout=None)
+
+        for route, values in counters.items():
+            for name, value in values.items():
+                key = f'metrics:{route}:{name}'
+                try:
+                    cache.incr(key, value)
+                except ValueError:
+                    cache.add(key, value, timeout=None)
+        for route, sample in samples.items():
+            cache.set(f'metrics:{route}:n_plus_one_sample', sample, timeout=None)
+
+
+aggregator = MetricsAggregator()
+# Counters of the last interval would be lost otherwise.
+atexit.register(aggregator.flush)
+
+
+def read_metrics():
+    """Returns the flushed counters of every route, as written by all processes."""
+    routes = cache.get(ROUTES_KEY, [])
+    keys = [f'metrics:{route}:{name}' for route in routes for name in COUNTERS + ('n_plus_one_sample',)]
+    values = cache.get_many(keys)
+    return {
+        route: {name: values.get(f'metrics:{route}:{name}', 0) for name in COUNTERS + ('n_plus_one_sample',)}
+        for route in routes
+    }
+
+
+def reset_metrics():
+    routes = cache.get(ROUTES_KEY, [])
+    cache.delete_many([f'metrics:{route}:{name}' for route in routes for name in COUNTERS + ('n_plus_one_sample',)])
+    cache.delete(ROUTES_KEY)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records query count, DB time, serializer time, total time and response size per resolved
+    route. The numbers are also sent back in a Server-Timing header to every response with
+    REQUEST_METRICS_HEADER enabled, or to requests whose X-Request-Metrics header carries
+    REQUEST_METRICS_TOKEN.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.REQUEST_METRICS:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(metrics):
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+
+        if self.record(request, response, metrics, time.perf_counter() - start):
+            aggregator.flush()
+        return response
+
+    async def __acall__(self, request):
+        if not settings.REQUEST_METRICS:
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        # Queries of the request run in its sync thread, whose connection is not the one of the loop.
+        await sync_to_async(add_execute_wrapper)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(remove_execute_wrapper)(metrics)
+            current_metrics.reset(token)
+
+        if self.record(request, response, metrics, time.perf_counter() - start):
+            await sync_to_async(aggregator.flush)()
+        return response
+
+    def record(self, request, response, metrics, elapsed):
+        match = request.resolver_match
+        route = f'{request.method}:/{match.route}' if match else f'{request.method}:<unresolved>'
+        size = 0 if response.streaming else len(response.content)
+        flush = aggregator.record(route, elapsed, metrics, size)
+
+        if wants_server_timing(request):
+            response['Server-Timing'] = (
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries", '
+                f'serializer;dur={metrics.serializer_time * 1000:.1f}, total;dur={elapsed * 1000:.1f}'
+            )
+        return flush
+
+
+def wants_server_timing(request):
+    if settings.REQUEST_METRICS_HEADER:
+        return True
+    token = request.headers.get('X-Request-Metrics')
+    return bool(token and settings.REQUEST_METRICS_TOKEN and constant_time_compare(token, settings.REQUEST_METRICS_TOKEN))
+
+
+def add_execute_wrapper(wrapper):
+    connection.execute_wrappers.append(wrapper)
+
+
+def remove_execute_wrapper(wrapper):
+    connection.execute_wrappers.remove(wrapper)
@@ -0,0 +1,117 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:18
+
+import django.contrib.auth.models
+import django.contrib.postgres.fields
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('ad_type', models.CharField(choices=[('sale', 'Sale'), ('rent', 'Rent')], max_length=4)),
+                ('location', models.CharField(choices=[('All', 'All'), ('Berovo', 'Berovo'), ('Bitola', 'Bitola'), ('Bogdanci', 'Bogdanci'), ('Debar', 'Debar'), ('Delčevo', 'Delčevo'), ('Demir Hisar', 'Demir Hisar'), ('Gevgelija', 'Gevgelija'), ('Gostivar', 'Gostivar'), ('Kavadarci', 'Kavadarci'), ('Kičevo', 'Kičevo'), ('Kočani', 'Kočani'), ('Kriva Palanka', 'Kriva Palanka'), ('Kruševo', 'Kruševo'), ('Kumanovo', 'Kumanovo'), ('Makedonska Kamenica', 'Makedonska Kamenica'), ('Makedonski Brod', 'Makedonski Brod'), ('Negotino', 'Negotino'), ('Ohrid', 'Ohrid'), ('Prilep', 'Prilep'), ('Probistip', 'Probistip'), ('Radoviš', 'Radoviš'), ('Resen', 'Resen'), ('Sveti Nikole', 'Sveti Nikole'), ('Štip', 'Štip'), ('Struga', 'Struga'), ('Strumica', 'Strumica'), ('Sveti Nikole', 'Sveti Nikole'), ('Tearce', 'Tearce'), ('Tetovo', 'Tetovo'), ('Valandovo', 'Valandovo'), ('Veles', 'Veles'), ('Vinica', 'Vinica'), ('Želino', 'Želino'), ('Skopje', 'Skopje')], default='All', max_length=150)),
+                ('address', models.CharField(default='Macedonia', max_length=150)),
+                ('image_urls', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(blank=True, max_length=500, null=True), default=list, size=None)),
+                ('created_at', models.DateField(auto_now_add=True)),
+                ('updated_at', models.DateField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('category', models.CharField(choices=[('All', 'All'), ('general', 'General'), ('car', 'Car'), ('motorcycle', 'Motorcycle'), ('house', 'House')], default=('All', 'All'), max_length=100)),
+                ('is_featured', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CustomUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('is_active', models.BooleanField(default=True, help_text='Designates whether this user should be treated as active. Unselect this instead of deleting accounts.', verbose_name='active')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+                ('role', models.CharField(choices=[('superadmin', 'Superadmin'), ('admin', 'Admin'), ('user', 'User')], default='user', max_length=10)),
+                ('phone_number', models.CharField(blank=True, max_length=100, null=True)),
+                ('email', models.EmailField(error_messages={'unique': 'A user with that email already exists.'}, max_length=254, unique=True, verbose_name='email address')),
+                ('first_name', models.CharField(max_length=150)),
+                ('last_name', models.CharField(max_length=150)),
+                ('username', models.CharField(blank=True, max_length=150, null=True)),
+                ('date_of_birth', models.DateField(blank=True, null=True)),
+                ('is_verified', models.BooleanField(default=False)),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='customuser_set', related_query_name='customuser', to='auth.group')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='customuser_set', related_query_name='customuser', to='auth.permission')),
+            ],
+            options={
+                'verbose_name': 'user',
+                'verbose_name_plural': 'users',
+                'abstract': False,
+            },
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CarAd',
+            fields=[
+                ('ad_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='oglas.ad')),
+                ('manufacturer', models.CharField(choices=[('All', 'All'), ('Audi', 'Audi'), ('BMW', 'BMW'), ('Mercedes-Benz', 'Mercedes-Benz'), ('Volkswagen', 'Volkswagen'), ('Toyota', 'Toyota'), ('Honda', 'Honda'), ('Ford', 'Ford'), ('Chevrolet', 'Chevrolet'), ('Nissan', 'Nissan'), ('Hyundai', 'Hyundai'), ('Kia', 'Kia'), ('Subaru', 'Subaru'), ('Mazda', 'Mazda'), ('Volvo', 'Volvo'), ('Lexus', 'Lexus'), ('Jeep', 'Jeep'), ('Tesla', 'Tesla'), ('Ferrari', 'Ferrari'), ('Porsche', 'Porsche'), ('Jaguar', 'Jaguar'), ('Land Rover', 'Land Rover'), ('Mitsubishi', 'Mitsubishi'), ('Suzuki', 'Suzuki'), ('Chrysler', 'Chrysler'), ('Dodge', 'Dodge'), ('Acura', 'Acura'), ('Buick', 'Buick'), ('Cadillac', 'Cadillac'), ('Infiniti', 'Infiniti'), ('Lincoln', 'Lincoln'), ('Mini', 'Mini'), ('Smart', 'Smart'), ('Other', 'Other')], max_length=100)),
+                ('year', models.IntegerField()),
+                ('mileage', models.IntegerField()),
+                ('fuel_type', models.CharField(choices=[('All', 'All'), ('Gasoline', 'Gasoline'), ('Diesel', 'Diesel'), ('Electric', 'Electric'), ('Hybrid', 'Hybrid')], max_length=100)),
+                ('color', models.CharField(choices=[('All', 'All'), ('Red', 'Red'), ('Blue', 'Blue'), ('Green', 'Green'), ('Yellow', 'Yellow'), ('Black', 'Black'), ('White', 'White'), ('Silver', 'Silver'), ('Gray', 'Gray'), ('Brown', 'Brown'), ('Orange', 'Orange'), ('Purple', 'Purple'), ('Other', 'Other')], max_length=100)),
+                ('car_type', models.CharField(choices=[('All', 'All'), ('Compact Car', 'Compact Car'), ('Sedan', 'Sedan'), ('Hatchback', 'Hatchback'), ('Estate car', 'Estate car'), ('Coupe', 'Coupe'), ('Cabriolet', 'Cabriolet'), ('SUV', 'SUV'), ('Minibus', 'Minibus'), ('Other', 'Other')], max_length=100)),
+            ],
+            bases=('oglas.ad',),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='Auction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('starting_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('current_price', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('end_time', models.DateTimeField()),
+                ('ad', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='oglas.ad')),
+                ('winner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='won_auctions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Bid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bid_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('bid_time', models.DateTimeField(auto_now_add=True)),
+                ('is_highest_bid', models.BooleanField(default=False)),
+                ('auction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='oglas.auction')),
+                ('bidder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Wishlist',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('added_date', models.DateField(auto_now_add=True)),
+                ('ad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='oglas.ad')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oglas', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['-created_at', '-id'], name='ad_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['price', 'id'], name='ad_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['category', 'location', '-created_at', '-id'], name='ad_cat_loc_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['category', 'price', 'id'], name='ad_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['location', '-created_at', '-id'], name='ad_loc_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('is_featured', True)), fields=['is_active', '-created_at'], name='ad_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carad',
+            index=models.Index(fields=['manufacturer', 'year', 'mileage'], name='carad_make_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carad',
+            index=models.Index(fields=['car_type', 'fuel_type', 'year'], name='carad_type_fuel_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carad',
+            index=models.Index(fields=['year', 'mileage'], name='carad_year_mileage_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carad',
+            index=models.Index(fields=['mileage'], name='carad_mileage_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carad',
+            index=models.Index(fields=['color'], name='carad_color_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oglas', '0003_ad_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
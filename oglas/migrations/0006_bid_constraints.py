@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oglas', '0005_pendingimagedeletion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['auction', '-bid_amount'], name='bid_auction_amount_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bid',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_highest_bid', True)), fields=('auction',), name='bid_one_highest_per_auction'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oglas', '0006_bid_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auction',
+            name='is_closed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='auction',
+            index=models.Index(condition=models.Q(('is_closed', False)), fields=['end_time'], name='auction_open_end_time_idx'),
+        ),
+    ]
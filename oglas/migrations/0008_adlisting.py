@@ -0,0 +1,39 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oglas', '0007_auction_is_closed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdListing',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('category', models.CharField(max_length=100)),
+                ('location', models.CharField(max_length=150)),
+                ('ad_type', models.CharField(max_length=4)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateField()),
+                ('is_active', models.BooleanField()),
+                ('is_featured', models.BooleanField()),
+                ('manufacturer', models.CharField(max_length=100, null=True)),
+                ('year', models.IntegerField(null=True)),
+                ('mileage', models.IntegerField(null=True)),
+                ('fuel_type', models.CharField(max_length=100, null=True)),
+                ('color', models.CharField(max_length=100, null=True)),
+                ('car_type', models.CharField(max_length=100, null=True)),
+                ('payload', models.JSONField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-created_at', '-id'], name='listing_newest_idx'), models.Index(fields=['price', 'id'], name='listing_price_idx'), models.Index(fields=['category', 'location', '-created_at', '-id'], name='listing_cat_loc_newest_idx'), models.Index(fields=['category', 'price', 'id'], name='listing_cat_price_idx'), models.Index(fields=['location', '-created_at', '-id'], name='listing_loc_newest_idx'), models.Index(fields=['manufacturer', 'year', 'mileage'], name='listing_make_year_idx'), models.Index(fields=['car_type', 'fuel_type', 'year'], name='listing_type_fuel_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:54
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oglas', '0008_adlisting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adlisting',
+            name='similar_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='adlisting',
+            name='similar_stale',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='adlisting',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='listing_cat_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adlisting',
+            index=models.Index(condition=models.Q(('similar_stale', True)), fields=['category', 'id'], name='listing_similar_stale_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oglas', '0009_adlisting_similar_ads'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adlisting',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_featured', True)), fields=['id'], name='listing_featured_idx'),
+        ),
+    ]
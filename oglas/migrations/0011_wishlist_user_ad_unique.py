@@ -0,0 +1,25 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+def delete_duplicates(apps, schema_editor):
+    # The old check-then-create in AddToWishlist could race, keep the first copy of each pair.
+    Wishlist = apps.get_model('oglas', 'Wishlist')
+    first_ids = Wishlist.objects.values('user', 'ad').annotate(first_id=models.Min('id')).values('first_id')
+    Wishlist.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oglas', '0010_adlisting_featured_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wishlist',
+            constraint=models.UniqueConstraint(fields=('user', 'ad'), name='wishlist_user_ad_unique'),
+        ),
+    ]
@@ -1,12 +1,13 @@
-from urllib.parse import unquote
-
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from firebase_admin import storage
+
+from .storage import blob_name_from_url
 
 class CustomUser(AbstractUser):
     USER_ROLES = (
@@ -112,32 +113,58 @@ class Ad(models.Model):
     is_active = models.BooleanField(default=True)
     category = models.CharField(max_length=100, choices=CATEGORY_CHOICES, default=CATEGORY_CHOICES[0])
     is_featured = models.BooleanField(default=False)
+    # Bumped on every save, ETags are derived from it instead of the serialized ad.
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # Mirrors the filter and sort combinations used by AdListView and FeaturedAdsView.
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='ad_newest_idx'),
+            models.Index(fields=['price', 'id'], name='ad_price_idx'),
+            models.Index(fields=['category', 'location', '-created_at', '-id'], name='ad_cat_loc_newest_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='ad_cat_price_idx'),
+            models.Index(fields=['location', '-created_at', '-id'], name='ad_loc_newest_idx'),
+            models.Index(fields=['is_active', '-created_at'], name='ad_featured_idx',
+                         condition=models.Q(is_featured=True)),
+            # The full-text and trigram GIN indexes for search are created by migration 0003.
+        ]
+
+    def save(self, *args, **kwargs):
+        # Incremented in SQL, two saves of the same loaded ad must not both write version N + 1.
+        stored = not self._state.adding
+        self.version = F('version') + 1 if stored else self.version + 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+        if stored:
+            self.refresh_from_db(fields=['version'])
 
-    def delete(self, *args, **kwargs):
-        # Delete images from Firebase Storage
-        if self.image_urls:
-            for url in self.image_urls:
-                # Extract filename from the URL
-                filename_with_params = url.split('/')[-1]
-                filename = unquote(filename_with_params.split('?')[0])  # Decode URL and remove query params
-
-                # Initialize Firebase Storage
-                bucket = storage.bucket()
-
-                # Delete the file
-                try:
-                    blob = bucket.blob(filename)
-                    blob.delete()
-                    print(f"Successfully deleted image {filename} from Firebase Storage")
-                except Exception as e:
-                    print(f"Failed to delete image {filename} from Firebase Storage: {e}")
-
-        # Call the parent delete method
-        super().delete(*args, **kwargs)
     def __str__(self):
         return self.title
 
 
+class PendingImageDeletion(models.Model):
+    """Outbox of storage blobs left behind by deleted ads, drained by the delete_images command."""
+    blob_name = models.CharField(max_length=500)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.blob_name
+
+
+@receiver(post_delete, sender=Ad)
+def queue_image_deletion(sender, instance, **kwargs):
+    # A signal instead of Ad.delete so queryset deletes and the cascade from CustomUser are covered too.
+    if instance.image_urls:
+        PendingImageDeletion.objects.bulk_create([
+            PendingImageDeletion(blob_name=blob_name_from_url(url)) for url in instance.image_urls if url
+        ])
+
+
 class Auction(models.Model):
     ad = models.OneToOneField(Ad, on_delete=models.CASCADE)
     starting_price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -145,6 +172,13 @@ class Auction(models.Model):
     end_time = models.DateTimeField()
     winner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True,
                                related_name='won_auctions',)
+    is_closed = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Lets the close_auctions worker find expired auctions without scanning closed ones.
+            models.Index(fields=['end_time'], condition=models.Q(is_closed=False), name='auction_open_end_time_idx'),
+        ]
 
     def __str__(self):
         return f"Auction for {self.ad.title}"
@@ -157,6 +191,15 @@ class Bid(models.Model):
     bid_time = models.DateTimeField(auto_now_add=True)
     is_highest_bid = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['auction'], condition=models.Q(is_highest_bid=True),
+                                    name='bid_one_highest_per_auction'),
+        ]
+        indexes = [
+            models.Index(fields=['auction', '-bid_amount'], name='bid_auction_amount_idx'),
+        ]
+
     def __str__(self):
         return f"Bid of {self.bid_amount} by {self.bidder.username} for {self.auction.ad.title}"
 
@@ -170,6 +213,12 @@ class Wishlist(models.Model):
     ad = models.ForeignKey(Ad, on_delete=models.CASCADE)
     added_date = models.DateField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # Also the index behind the per user wishlist and membership lookups.
+            models.UniqueConstraint(fields=['user', 'ad'], name='wishlist_user_ad_unique'),
+        ]
+
     def __str__(self):
         return f"{self.user.username}'s wishlist"
 
@@ -258,6 +307,15 @@ class CarAd(Ad):
     color = models.CharField(max_length=100, choices=COLOR_CHOICES)
     car_type = models.CharField(max_length=100, choices=CAR_TYPE_CHOICES)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['manufacturer', 'year', 'mileage'], name='carad_make_year_idx'),
+            models.Index(fields=['car_type', 'fuel_type', 'year'], name='carad_type_fuel_idx'),
+            models.Index(fields=['year', 'mileage'], name='carad_year_mileage_idx'),
+            models.Index(fields=['mileage'], name='carad_mileage_idx'),
+            models.Index(fields=['color'], name='carad_color_idx'),
+        ]
+
     @receiver(post_delete, sender=Ad)
     def delete_related_car_ad(sender, instance, **kwargs):
         if instance.category == 'car':
@@ -268,3 +326,86 @@ class CarAd(Ad):
                 pass
     def __str__(self):
         return self.title
+
+
+class AdListing(models.Model):
+    """
+    Read model of the ads feed, one flat row per ad kept up to date by oglas.listings. Holds the
+    filter and sort columns of AdListView next to the ad as serialized by AdSerializer, so a page
+    is read from this table alone and served without joins or serialization.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    category = models.CharField(max_length=100)
+    location = models.CharField(max_length=150)
+    ad_type = models.CharField(max_length=4)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateField()
+    is_active = models.BooleanField()
+    is_featured = models.BooleanField()
+    manufacturer = models.CharField(max_length=100, null=True)
+    year = models.IntegerField(null=True)
+    mileage = models.IntegerField(null=True)
+    fuel_type = models.CharField(max_length=100, null=True)
+    color = models.CharField(max_length=100, null=True)
+    car_type = models.CharField(max_length=100, null=True)
+    payload = models.JSONField()
+    # The most similar ads best first, written by the compute_similar_ads command. Every write to
+    # the listing marks it stale so the command picks it up again.
+    similar_ids = ArrayField(models.BigIntegerField(), default=list)
+    similar_stale = models.BooleanField(default=True)
+
+    class Meta:
+        # Same filter and sort combinations as the Ad and CarAd indexes.
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='listing_newest_idx'),
+            models.Index(fields=['price', 'id'], name='listing_price_idx'),
+            models.Index(fields=['category', 'location', '-created_at', '-id'], name='listing_cat_loc_newest_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='listing_cat_price_idx'),
+            models.Index(fields=['location', '-created_at', '-id'], name='listing_loc_newest_idx'),
+            models.Index(fields=['manufacturer', 'year', 'mileage'], name='listing_make_year_idx'),
+            models.Index(fields=['car_type', 'fuel_type', 'year'], name='listing_type_fuel_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='listing_cat_newest_idx'),
+            models.Index(fields=['category', 'id'], condition=models.Q(similar_stale=True),
+                         name='listing_similar_stale_idx'),
+            models.Index(fields=['id'], condition=models.Q(is_featured=True, is_active=True),
+                         name='listing_featured_idx'),
+        ]
+
+    def __str__(self):
+        return self.payload.get('title', '')
+
+
+def bulk_create_car_ads(car_ads, batch_size=None):
+    """
+    QuerySet.bulk_create() refuses multi-table inheritance, so the Ad rows are bulk inserted
+    first and the CarAd rows are then inserted in executemany() batches pointing at them. Like
+    bulk_create(), save() isn't called and no signals are sent.
+    """
+    parent_fields = [field.attname for field in Ad._meta.concrete_fields if not field.primary_key]
+    fields = CarAd._meta.local_concrete_fields
+    quote_name = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote_name(CarAd._meta.db_table),
+        ', '.join(quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    with transaction.atomic():
+        ads = Ad.objects.bulk_create(
+            [Ad(**{name: getattr(car_ad, name) for name in parent_fields}) for car_ad in car_ads],
+            batch_size=batch_size,
+        )
+        for car_ad, ad in zip(car_ads, ads):
+            for name in parent_fields:
+                setattr(car_ad, name, getattr(ad, name))
+            car_ad.ad_ptr_id = car_ad.id = ad.id
+            car_ad._state.adding = False
+            car_ad._state.db = ad._state.db
+
+        rows = [[field.get_db_prep_save(getattr(car_ad, field.attname), connection) for field in fields]
+                for car_ad in car_ads]
+        batch_size = batch_size or max(len(rows), 1)
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(sql, rows[start:start + batch_size])
+    return car_ads
@@ -0,0 +1,192 @@
+import asyncio
+import collections
+import json
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class AuctionChannel:
+    """
+    Fan-out of one auction inside one process. Publishing appends to a short backlog and wakes
+    every watcher through a single shared event, so it costs the same for one or thousands of them.
+    """
+    backlog_size = 100
+
+    def __init__(self):
+        self.messages = collections.deque(maxlen=self.backlog_size)
+        self.sequence = 0
+        self.event = asyncio.Event()
+        self.watchers = 0
+
+    def publish(self, message):
+        self.sequence += 1
+        self.messages.append((self.sequence, message))
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+    async def wait(self, after, timeout):
+        """Returns the (sequence, message) pairs published after ``after``, or [] when ``timeout`` passes."""
+        if self.sequence <= after:
+            try:
+                await asyncio.wait_for(self.event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        return [item for item in self.messages if item[0] > after]
+
+
+class InProcessBroker:
+    """
+    Delivers messages to the watchers of the current process only. Enough for tests and a
+    single ASGI worker; publish() may be called from any thread, e.g. a sync view. Messages
+    published before the first watcher subscribed have nobody to reach and are dropped.
+    """
+
+    def __init__(self):
+        self.channels = {}
+        self.loop = None
+
+    def publish(self, auction_id, message):
+        if self.loop is None or self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.deliver, auction_id, message)
+
+    def deliver(self, auction_id, message):
+        channel = self.channels.get(auction_id)
+        if channel is not None:
+            channel.publish(message)
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+
+    async def subscribe(self, auction_id):
+        if self.loop is not asyncio.get_running_loop():
+            # Channels belong to the loop their watchers wait on, a new loop starts without any.
+            self.channels = {}
+            await self.start()
+        channel = self.channels.setdefault(auction_id, AuctionChannel())
+        channel.watchers += 1
+        return channel
+
+    def unsubscribe(self, auction_id, channel):
+        channel.watchers -= 1
+        if not channel.watchers and self.channels.get(auction_id) is channel:
+            del self.channels[auction_id]
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Publishes through Redis pub/sub so watchers connected to any worker are notified. Every
+    process runs one listener that feeds its local channels. Needs the redis package.
+    """
+    channel_prefix = 'auction:'
+    # Seconds before reconnecting after Redis went away, doubled per failed attempt up to the maximum.
+    reconnect_delay = 0.5
+    max_reconnect_delay = 30
+
+    def __init__(self):
+        super().__init__()
+        import redis
+
+        self.redis = redis.Redis.from_url(settings.REDIS_URL)
+        self.listener = None
+
+    def publish(self, auction_id, message):
+        self.redis.publish(f'{self.channel_prefix}{auction_id}', json.dumps(message, cls=DjangoJSONEncoder))
+
+    async def start(self):
+        await super().start()
+        if self.listener is None or self.listener.get_loop() is not self.loop:
+            self.listener = asyncio.create_task(self.listen())
+
+    async def listen(self):
+        """
+        Feeds the local channels until the loop stops. A dropped connection is retried with
+        backoff instead of ending every stream, watchers keep waiting meanwhile and only miss
+        what was published while Redis was unreachable.
+        """
+        import redis.asyncio
+        from redis.exceptions import ConnectionError, TimeoutError
+
+        delay = self.reconnect_delay
+        while True:
+            pubsub = redis.asyncio.Redis.from_url(settings.REDIS_URL).pubsub()
+            try:
+                await pubsub.psubscribe(f'{self.channel_prefix}*')
+                delay = self.reconnect_delay
+                async for item in pubsub.listen():
+                    if item['type'] != 'pmessage':
+                        continue
+                    auction_id = int(item['channel'].decode().removeprefix(self.channel_prefix))
+                    self.deliver(auction_id, json.loads(item['data']))
+            except (ConnectionError, TimeoutError, OSError):
+                pass
+            finally:
+                await pubsub.reset()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.AUCTION_BROKER)()
+    return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    global _broker
+    if setting == 'AUCTION_BROKER':
+        _broker = None
+
+
+def publish_bid(bid, current_price):
+    get_broker().publish(bid.auction_id, {
+        'type': 'bid',
+        'auction': bid.auction_id,
+        'current_price': current_price,
+        'bid': {'id': bid.id, 'bidder': bid.bidder_id, 'bid_amount': bid.bid_amount, 'bid_time': bid.bid_time},
+    })
+
+
+def publish_closed(auction_ids):
+    broker = get_broker()
+    for auction_id in auction_ids:
+        broker.publish(auction_id, {'type': 'closed', 'auction': auction_id})
+
+
+def format_event(message):
+    return f'event: {message["type"]}\ndata: {json.dumps(message, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def auction_events(auction_id, channel, sequence, state):
+    """
+    Server-sent events of one auction: ``state`` as read after subscribing, then every message
+    published after ``sequence`` until the auction closes. Comment lines keep idle connections open through proxies.
+    """
+    broker = get_broker()
+    try:
+        yield format_event({'type': 'state', 'auction': auction_id, **state})
+        if state['is_closed']:
+            return
+        while True:
+            items = await channel.wait(sequence, settings.AUCTION_STREAM_KEEPALIVE)
+            if not items:
+                yield ': keepalive\n\n'
+                continue
+            for sequence, message in items:
+                yield format_event(message)
+                if message['type'] == 'closed':
+                    return
+    finally:
+        broker.unsubscribe(auction_id, channel)
@@ -0,0 +1,38 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Upper
+
+# Listings are written in Macedonian as well as English, so no language specific stemming.
+SEARCH_CONFIG = 'simple'
+
+# Must stay identical to the expressions indexed in migration 0003, otherwise the planner can't use them.
+AD_SEARCH_VECTOR = (
+    SearchVector('title', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+)
+AD_TITLE_TRIGRAM = Upper('title')
+
+
+def search_ads(queryset, term):
+    """
+    Filters ``queryset`` down to ads matching ``term`` and annotates each one with a ``rank``.
+
+    On PostgreSQL whole words are matched through the full-text index over title and description,
+    and partial words through the trigram index on the title. Other databases fall back to a plain
+    ``icontains`` match so the test suite can run without PostgreSQL.
+    """
+    term = term.strip()
+    if not term:
+        return queryset
+
+    if connection.vendor != 'postgresql':
+        return queryset.filter(Q(title__icontains=term) | Q(description__icontains=term)).annotate(
+            rank=Case(When(title__icontains=term, then=Value(1.0)), default=Value(0.5), output_field=FloatField())
+        )
+
+    query = SearchQuery(term, search_type='websearch', config=SEARCH_CONFIG)
+    return queryset.alias(search=AD_SEARCH_VECTOR).annotate(
+        # ts_rank returns a real; as a double precision it survives a round trip through a cursor.
+        rank=Cast(SearchRank(AD_SEARCH_VECTOR, query), FloatField()),
+    ).filter(Q(search=query) | Q(title__icontains=term))
@@ -1,4 +1,11 @@
+from functools import reduce
+from operator import itemgetter
+
+from django.db import connection
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import JSONObject
 from rest_framework import serializers
+from .metrics import InstrumentedSerializerMixin
 from .models import CustomUser, Ad, Auction, Bid, Wishlist, CarAd
 from dj_rest_auth.registration.serializers import RegisterSerializer
 
@@ -28,13 +35,114 @@ class CustomRegisterSerializer(RegisterSerializer):
 #             'phone_number': request.user.phone_number,
 #         }
 #     return data
-class UserInfoSerializer(serializers.ModelSerializer):
+def parse_fieldset(value):
+    """
+    Parses comma separated field names into a tree, dotted names reach into nested serializers:
+    'id,ad.title,ad.owner.email' gives {'id': {}, 'ad': {'title': {}, 'owner': {'email': {}}}}.
+    """
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in filter(None, path.strip().split('.')):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def get_fieldset(params):
+    """The ``fields``, ``exclude`` and ``expand`` serializer arguments requested by query ``params``."""
+    return {name: parse_fieldset(params.get(name)) for name in ('fields', 'exclude', 'expand')}
+
+
+class SparseFieldsetMixin:
+    """
+    Lets a request choose the fields it gets back. ``fields`` keeps only the named fields,
+    ``exclude`` drops the named ones and ``expand`` adds the Meta.expandable_fields, which are left
+    out unless asked for. All three are trees from parse_fieldset() and apply to nested sparse
+    serializers too. setup_sparse_loading() then loads only the columns the remaining fields read.
+    """
+
+    def __init__(self, *args, fields=None, exclude=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.apply_fieldset(fields or {}, exclude or {}, expand or {})
+
+    def apply_fieldset(self, fields, exclude, expand):
+        if not fields and not exclude and not expand:
+            return
+        for name, (serializer_class, options) in getattr(self.Meta, 'expandable_fields', {}).items():
+            if name in expand:
+                self.fields[name] = serializer_class(**options)
+        if fields:
+            for name in set(self.fields) - set(fields) - set(expand):
+                self.fields.pop(name)
+        for name, nested in exclude.items():
+            if not nested:
+                self.fields.pop(name, None)
+        for name, field in self.fields.items():
+            if isinstance(field, SparseFieldsetMixin):
+                field.apply_fieldset(fields.get(name, {}), exclude.get(name, {}), expand.get(name, {}))
+
+    def get_field_tree(self):
+        """The remaining fields as a parse_fieldset() tree, nested sparse serializers spelled out."""
+        return {name: field.get_field_tree() if isinstance(field, SparseFieldsetMixin) else {}
+                for name, field in self.fields.items()}
+
+    def get_only(self, prefix=''):
+        """
+        The model fields read by the remaining fields as only() arguments, and the relations to
+        select_related() for them. Meta.field_columns lists the columns of computed fields.
+        """
+        only, related = [], []
+        field_columns = getattr(self.Meta, 'field_columns', {})
+        for name, field in self.fields.items():
+            if name in field_columns:
+                columns = [prefix + column for column in field_columns[name]]
+                only += columns
+                related += [column.rsplit('__', 1)[0] for column in columns if column.count('__') > prefix.count('__')]
+            elif isinstance(field, SparseFieldsetMixin):
+                nested_only, nested_related = field.get_only(f'{prefix}{field.source}__')
+                only += nested_only
+                related += [prefix + field.source, *nested_related]
+            elif field.source != '*':
+                only.append(prefix + field.source.replace('.', '__'))
+        return only, related
+
+    def setup_sparse_loading(self, queryset):
+        only, related = self.get_only()
+        return load_only(queryset, only, related)
+
+
+def load_only(queryset, only, related):
+    if related:
+        # Without arguments select_related() would follow every foreign key.
+        queryset = queryset.select_related(*dict.fromkeys(related))
+    return queryset.only(*only)
+
+
+def project_payload(payload, tree):
+    """Cuts a serialized ``payload`` down to the fields of ``tree`` like the serializer would have."""
+    return {name: project_payload(payload[name], nested) if nested and isinstance(payload[name], dict) else payload[name]
+            for name, nested in tree.items() if name in payload}
+
+
+def payload_projection(tree, path=()):
+    """project_payload() as a SQL expression over the AdListing.payload column."""
+    columns = {}
+    for name, nested in tree.items():
+        if nested:
+            columns[name] = payload_projection(nested, (*path, name))
+        else:
+            columns[name] = reduce(lambda expression, key: KeyTransform(key, expression), (*path, name), 'payload')
+    return JSONObject(**columns)
+
+
+USER_INFO_FIELDS = ['id', 'username', 'first_name', 'last_name', 'email', 'phone_number', 'date_of_birth', 'role']
+CAR_DETAIL_FIELDS = ['manufacturer', 'car_type', 'color', 'fuel_type', 'mileage', 'year']
+
+
+class UserInfoSerializer(SparseFieldsetMixin, InstrumentedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = CustomUser
-        fields = [
-            'id', 'username', 'first_name', 'last_name', 'email',
-            'phone_number', 'date_of_birth', 'role'
-        ]
+        fields = USER_INFO_FIELDS
 
 
 class UserProfileUpdateSerializer(serializers.ModelSerializer):
@@ -46,25 +154,50 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
         fields = ['first_name', 'last_name', 'phone_number', 'email', 'username']
 
 
-class AuctionSerializer(serializers.ModelSerializer):
+class AuctionSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Auction
-        fields = ['id', 'ad', 'starting_price', 'current_price', 'end_time', 'winner']
+        fields = ['id', 'ad', 'starting_price', 'current_price', 'end_time', 'winner', 'is_closed']
 
 
-class BidSerializer(serializers.ModelSerializer):
+class BidSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Bid
         fields = ['id', 'auction', 'bidder', 'bid_amount', 'bid_time', 'is_highest_bid']
 
 
-class AdSerializer(serializers.ModelSerializer):
+class PlaceBidSerializer(serializers.Serializer):
+    bid_amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+
+
+class AdFilterParamsSerializer(serializers.Serializer):
+    """The typed AdListView filter parameters, blank ones count as not given."""
+    fromDate = serializers.DateField(required=False)
+    toDate = serializers.DateField(required=False)
+    priceFrom = serializers.DecimalField(max_digits=None, decimal_places=None, required=False)
+    priceTo = serializers.DecimalField(max_digits=None, decimal_places=None, required=False)
+    yearFrom = serializers.IntegerField(required=False)
+    yearTo = serializers.IntegerField(required=False)
+    mileageFrom = serializers.IntegerField(required=False)
+    mileageTo = serializers.IntegerField(required=False)
+
+    def to_internal_value(self, data):
+        return super().to_internal_value({name: value for name, value in data.items() if value != ''})
+
+
+class AdSerializer(SparseFieldsetMixin, InstrumentedSerializerMixin, serializers.ModelSerializer):
     owner = UserInfoSerializer(read_only=True)
     car_details = serializers.SerializerMethodField()
 
     class Meta:
         model = Ad
-        fields = '__all__'
+        # version only feeds the ETags.
+        exclude = ['version']
+        # get_car_details() reads the CarAd row and hands it the owner.
+        field_columns = {
+            'car_details': ['category', *(f'carad__{name}' for name in CAR_DETAIL_FIELDS),
+                            *(f'owner__{name}' for name in USER_INFO_FIELDS)],
+        }
 
     def create(self, validated_data):
         image_urls = validated_data.pop('image_urls', [])
@@ -73,28 +206,154 @@ class AdSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # Join the owner and the CarAd child row so a whole page serializes from one query.
+        if queryset.model is CarAd:
+            return queryset.select_related('owner')
+        return queryset.select_related('owner', 'carad')
+
+    def setup_sparse_loading(self, queryset):
+        only, related = self.get_only()
+        if queryset.model is CarAd:
+            # Car columns live on the queried row itself.
+            only = [name.removeprefix('carad__') for name in only]
+            related = [name for name in related if name != 'carad']
+        return load_only(queryset, only, related)
+
     def get_car_details(self, obj):
-        if obj.category == 'car':
+        if obj.category != 'car':
+            return None
+        if isinstance(obj, CarAd):
+            car_ad = obj
+        else:
             try:
-                car_ad = CarAd.objects.get(id=obj.id)
-                return CarAdSerializer(car_ad).data
+                car_ad = obj.carad
             except CarAd.DoesNotExist:
                 return None
-        return None
+            # The owner is already loaded on the parent row, don't fetch it again.
+            car_ad.owner = obj.owner
+        return CarAdSerializer(car_ad).data
 
 
-class CarAdSerializer(serializers.ModelSerializer):
+class AdListingSerializer(InstrumentedSerializerMixin, serializers.BaseSerializer):
+    """
+    The AdListing read model stores the AdSerializer output, there is nothing left to compute.
+    Takes the same fieldset arguments as AdSerializer and cuts the stored payload down to match,
+    on PostgreSQL already in the query made by setup_sparse_loading().
+    """
+
+    def __init__(self, *args, fields=None, exclude=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.field_tree = None
+        if fields or exclude or expand:
+            self.field_tree = AdSerializer(fields=fields, exclude=exclude, expand=expand).get_field_tree()
+
+    def setup_sparse_loading(self, queryset):
+        if self.field_tree is None or connection.vendor != 'postgresql':
+            return queryset
+        # SQLite's JSON_OBJECT() would turn nested nulls and booleans into strings.
+        return queryset.defer('payload').annotate(projected_payload=payload_projection(self.field_tree))
+
+    def to_representation(self, instance):
+        # Featured ads come as cached payloads, listings with the payload whole or projected.
+        if isinstance(instance, dict):
+            payload = instance
+        elif hasattr(instance, 'projected_payload'):
+            return instance.projected_payload
+        else:
+            payload = instance.payload
+        return payload if self.field_tree is None else project_payload(payload, self.field_tree)
+
+
+class AdCardSerializer(SparseFieldsetMixin, InstrumentedSerializerMixin, serializers.ModelSerializer):
+    """What an ad card shows, for lists where the whole ad would be wasted."""
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Ad
+        fields = ['id', 'title', 'price', 'ad_type', 'location', 'category', 'created_at', 'is_active', 'image']
+        expandable_fields = {'owner': (UserInfoSerializer, {'read_only': True})}
+        field_columns = {'image': ['image_urls']}
+
+    def get_image(self, obj):
+        return next((url for url in obj.image_urls if url), None)
+
+
+class CarAdSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     owner = UserInfoSerializer(read_only=True)
 
     class Meta:
         model = CarAd
-        fields = ['manufacturer', 'car_type', 'color', 'fuel_type', 'mileage', 'year', 'owner']
+        fields = [*CAR_DETAIL_FIELDS, 'owner']
+
+
+def row_getter(field, column):
+    # Decimals and dates need formatting, every other value AdSerializer would pass through as it is.
+    if isinstance(field, (serializers.DecimalField, serializers.DateField, serializers.DateTimeField)):
+        return lambda row: None if row[column] is None else field.to_representation(row[column])
+    return itemgetter(column)
+
+
+def nested_getter(getters):
+    return lambda row: {name: get(row) for name, get in getters}
+
+
+class AdRowSerializer(InstrumentedSerializerMixin, serializers.BaseSerializer):
+    """
+    AdSerializer output built from flat .values() rows, for read-only lists of whole ads. Each ad
+    is one pass over getters worked out once, instead of a run through DRF's fields and a model
+    instance for the ad, its owner and its CarAd row.
+    """
+    getters = {}
+
+    @staticmethod
+    def get_car_prefix(model):
+        # Car columns live on the queried row itself for CarAd querysets.
+        return '' if model is CarAd else 'carad__'
+
+    @classmethod
+    def get_columns(cls, model):
+        car_prefix = cls.get_car_prefix(model)
+        return [
+            *(name for name in AdSerializer().fields if name not in ('owner', 'car_details')),
+            *(f'owner__{name}' for name in USER_INFO_FIELDS),
+            *(car_prefix + name for name in CAR_DETAIL_FIELDS),
+            *([car_prefix + 'pk'] if car_prefix else []),
+        ]
+
+    @classmethod
+    def get_getters(cls, car_prefix):
+        if car_prefix not in cls.getters:
+            get_owner = nested_getter([(name, row_getter(field, f'owner__{name}'))
+                                       for name, field in UserInfoSerializer().fields.items()])
+            car_fields = CarAdSerializer().fields
+            get_car = nested_getter([*((name, row_getter(car_fields[name], car_prefix + name)) for name in CAR_DETAIL_FIELDS),
+                                     ('owner', get_owner)])
+
+            def get_car_details(row):
+                if row['category'] != 'car' or (car_prefix and row[car_prefix + 'pk'] is None):
+                    return None
+                return get_car(row)
+
+            special = {'owner': get_owner, 'car_details': get_car_details}
+            cls.getters[car_prefix] = [(name, special.get(name) or row_getter(field, name))
+                                       for name, field in AdSerializer().fields.items()]
+        return cls.getters[car_prefix]
+
+    def setup_sparse_loading(self, queryset):
+        # Annotations stay in the rows, the cursor pagination reads the sort values from them.
+        return queryset.values(*self.get_columns(queryset.model), *queryset.query.annotations)
+
+    def to_representation(self, row):
+        getters = self.get_getters('carad__' if 'carad__pk' in row else '')
+        return {name: get(row) for name, get in getters}
 
 
 class EditCarAdSerializer(serializers.ModelSerializer):
     class Meta:
         model = CarAd
-        fields = '__all__'
+        exclude = ['version']
 
 
 class EditAdSerializer(serializers.ModelSerializer):
@@ -102,12 +361,20 @@ class EditAdSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Ad
-        fields = '__all__'
+        exclude = ['version']
 
 
-class WishlistSerializer(serializers.ModelSerializer):
+class WishlistSerializer(SparseFieldsetMixin, InstrumentedSerializerMixin, serializers.ModelSerializer):
     ad = AdSerializer()
 
     class Meta:
         model = Wishlist
         fields = ['id', 'user', 'ad', 'added_date']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('ad__owner', 'ad__carad')
+
+
+class WishlistCardSerializer(WishlistSerializer):
+    ad = AdCardSerializer()
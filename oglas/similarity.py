@@ -0,0 +1,93 @@
+import numpy as np
+
+from .cache import SIMILAR_NAMESPACE, bump_generations
+from .models import AdListing
+
+SIMILAR_ADS_STORED = 12
+# Candidates are the newest ads of the same category, which bounds the cost of scoring one ad.
+SIMILAR_POOL_SIZE = 20000
+# Upper bound of ads x candidates scored at once, about 32 MB per float64 array.
+SCORING_CELLS = 4_000_000
+
+FEATURE_FIELDS = ['id', 'location', 'ad_type', 'manufacturer', 'car_type', 'price', 'year', 'mileage']
+MATCH_WEIGHTS = {'location': 2.0, 'ad_type': 1.0, 'manufacturer': 1.5, 'car_type': 1.0}
+# Weight and the difference at which the closeness reaches zero: 4x the price, 10 years, 100000 km.
+CLOSENESS_WEIGHTS = {'price': (2.0, np.log(4)), 'year': (1.0, 10), 'mileage': (1.0, 100000)}
+
+
+def load_features(rows, vocabulary):
+    """
+    Turns ``rows`` of FEATURE_FIELDS values into one array per field. Text fields become integer
+    codes from ``vocabulary``, shared by everything scored together, and missing values -1 or NaN.
+    """
+    columns = dict(zip(FEATURE_FIELDS, zip(*rows))) if rows else dict.fromkeys(FEATURE_FIELDS, ())
+    features = {'id': np.array(columns['id'], dtype=np.int64)}
+    for field in MATCH_WEIGHTS:
+        codes = vocabulary.setdefault(field, {})
+        features[field] = np.array([-1 if value is None else codes.setdefault(value, len(codes))
+                                    for value in columns[field]], dtype=np.int32)
+    for field in CLOSENESS_WEIGHTS:
+        features[field] = np.array([np.nan if value is None else float(value) for value in columns[field]])
+    # Prices are compared by ratio, a 1000 difference means little on a car and a lot on a phone.
+    features['price'] = np.log1p(features['price'])
+    return features
+
+
+def score(ads, candidates):
+    """Scores every ad of ``ads`` against every one of ``candidates``, higher is more similar."""
+    scores = np.zeros((len(ads['id']), len(candidates['id'])))
+    for field, weight in MATCH_WEIGHTS.items():
+        a, b = ads[field][:, None], candidates[field][None, :]
+        scores += weight * ((a == b) & (a >= 0))
+    for field, (weight, span) in CLOSENESS_WEIGHTS.items():
+        closeness = 1 - np.abs(ads[field][:, None] - candidates[field][None, :]) / span
+        scores += weight * np.nan_to_num(np.clip(closeness, 0, 1))
+    # Candidates are ordered newest first, among equals the newer ad wins.
+    scores -= np.arange(len(candidates['id'])) * 1e-9
+    scores[ads['id'][:, None] == candidates['id'][None, :]] = -np.inf
+    return scores
+
+
+def top_neighbours(scores, candidate_ids, k):
+    """The ids of the ``k`` best scored candidates of each row of ``scores``, best first."""
+    k = min(k, scores.shape[1])
+    if not k:
+        return [[] for _ in range(scores.shape[0])]
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+    return [candidate_ids[row[row_scores > -np.inf]].tolist() for row, row_scores in zip(top, top_scores)]
+
+
+def compute_similar_ads(listings, k=SIMILAR_ADS_STORED):
+    """
+    Recomputes the similar_ids of the ``listings`` queryset, one category at a time: the features
+    of the category's candidates are loaded into arrays once and scored against batches of the
+    listings. A listing is marked fresh before its batch is scored, so one written to meanwhile
+    stays stale for the next run. Returns how many listings were updated.
+    """
+    updated = 0
+    for category in listings.order_by().values_list('category', flat=True).distinct():
+        vocabulary = {}
+        pool = AdListing.objects.filter(category=category).order_by('-created_at', '-id')
+        candidates = load_features(list(pool.values_list(*FEATURE_FIELDS)[:SIMILAR_POOL_SIZE]), vocabulary)
+        batch_size = max(1, SCORING_CELLS // max(len(candidates['id']), 1))
+
+        targets = listings.filter(category=category).order_by('id').values_list(*FEATURE_FIELDS)
+        last_id = 0
+        while rows := list(targets.filter(id__gt=last_id)[:batch_size]):
+            last_id = rows[-1][0]
+            ads = load_features(rows, vocabulary)
+            AdListing.objects.filter(id__in=ads['id'].tolist()).update(similar_stale=False)
+            neighbours = top_neighbours(score(ads, candidates), candidates['id'], k)
+            AdListing.objects.bulk_update(
+                [AdListing(id=ad_id, similar_ids=ids) for ad_id, ids in zip(ads['id'].tolist(), neighbours)],
+                ['similar_ids'],
+                batch_size=1000,
+            )
+            updated += len(rows)
+
+    if updated:
+        bump_generations([SIMILAR_NAMESPACE])
+    return updated
@@ -1,3 +1,1176 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from importlib.util import find_spec
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .bidding import BidRejected, place_bid
+from .cache import FEATURED_NAMESPACE, USERS_NAMESPACE, get_generations, get_response_cache
+from .listings import rebuild_listings
+from .metrics import LATENCY_BUCKETS_MS, RequestMetrics, aggregator, read_metrics, reset_metrics
+from .models import CustomUser, Ad, AdListing, CarAd, Wishlist, PendingImageDeletion, Auction, Bid, \
+    bulk_create_car_ads
+from .realtime import publish_closed
+from .renderers import FastJSONRenderer
+from .search import search_ads
+from .serializer import AdRowSerializer, AdSerializer
+from .storage import FirebaseStorageClient, InMemoryStorageClient, LocalFileSystemStorageClient, \
+    get_storage_client
+from .views import AD_SORT_ORDERINGS
+
+
+def create_user(email='user@oglas.mk'):
+    return CustomUser.objects.create_user(username=email, email=email, password='secret',
+                                          first_name='Test', last_name='User', is_verified=True)
+
+
+def create_ad(owner, **kwargs):
+    data = {
+        'title': 'Ad', 'description': 'Description', 'price': 100, 'ad_type': 'sale',
+        'location': 'Skopje', 'category': 'general', 'image_urls': [],
+    }
+    data.update(kwargs)
+    return Ad.objects.create(owner=owner, **data)
+
+
+def create_car_ad(owner, **kwargs):
+    data = {
+        'title': 'Car', 'description': 'Description', 'price': 5000, 'ad_type': 'sale',
+        'location': 'Skopje', 'category': 'car', 'image_urls': [], 'manufacturer': 'Audi',
+        'year': 2015, 'mileage': 120000, 'fuel_type': 'Diesel', 'color': 'Black', 'car_type': 'Sedan',
+    }
+    data.update(kwargs)
+    return CarAd.objects.create(owner=owner, **data)
+
+
+def create_auction(owner, **kwargs):
+    data = {'starting_price': 100, 'current_price': 0, 'end_time': timezone.now() + timedelta(days=1)}
+    data.update(kwargs)
+    return Auction.objects.create(ad=create_ad(owner), **data)
+
+
+class AdListQueryCountTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.client = APIClient()
+        self.user = create_user()
+        self.ad = create_ad(self.user, is_featured=True)
+        for i in range(5):
+            owner = create_user(f'owner{i}@oglas.mk')
+            create_ad(owner, title=f'Ad {i}', is_featured=True)
+            car = create_car_ad(owner, title=f'Car {i}', is_featured=True)
+            Wishlist.objects.create(user=self.user, ad=car)
+        self.client.force_authenticate(self.user)
+
+    def test_ad_list(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/ads/', {'size': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 11)
+        cars = [ad for ad in response.data['results'] if ad['category'] == 'car']
+        self.assertTrue(all(ad['car_details']['manufacturer'] == 'Audi' for ad in cars))
+
+    def test_car_ad_list(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/ads/', {'category': 'car', 'size': 100})
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_featured_ads(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/ads/featured/')
+        self.assertEqual(len(response.data), 4)
+
+        # Served from the cached slate, the 11 featured ads are shown four at a time in turn.
+        shown = [ad['id'] for ad in response.data]
+        with self.assertNumQueries(0):
+            for _ in range(2):
+                shown += [ad['id'] for ad in self.client.get('/ads/featured/').data]
+        self.assertEqual(len(set(shown)), 11)
+
+        ad = Ad.objects.get(id=shown[0])
+        ad.is_featured = False
+        ad.save()
+        shown = {ad['id'] for _ in range(3) for ad in self.client.get('/ads/featured/').data}
+        self.assertEqual(len(shown), 10)
+        self.assertNotIn(ad.id, shown)
+
+    def test_featured_ads_without_position(self):
+        dummy = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        with self.settings(CACHES={'default': dummy, 'responses': dummy}):
+            response = self.client.get('/ads/featured/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 4)
+
+    def test_similar_ads(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/ads/similar/{self.ad.id}/')
+        self.assertEqual(len(response.data), 4)
+
+    def test_user_ads(self):
+        for i in range(5):
+            create_car_ad(self.user, title=f'My car {i}')
+        with self.assertNumQueries(2):
+            response = self.client.get('/user-ads/', {'size': 100})
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_wishlist(self):
+        # One aggregate for the ETag, one for the count and one for the page.
+        with self.assertNumQueries(3):
+            response = self.client.get('/wishlist/')
+        self.assertEqual(response.data['count'], 5)
+        self.assertTrue(all(item['ad']['car_details'] for item in response.data['results']))
+
+    def test_wishlist_cards(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/wishlist/', {'projection': 'card', 'size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(set(response.data['results'][0]['ad']),
+                         {'id', 'title', 'price', 'ad_type', 'location', 'category', 'created_at', 'is_active', 'image'})
+        self.assertNotIn('description', queries[-1]['sql'])
+        self.assertNotIn('oglas_customuser', queries[-1]['sql'])
+
+        response = self.client.get('/wishlist/', {'projection': 'card', 'fields': 'id,ad.title', 'expand': 'ad.owner'})
+        self.assertEqual(response.data['results'][0]['ad'].keys(), {'title', 'owner'})
+        self.assertEqual(response.data['results'][0]['ad']['owner']['email'], 'owner4@oglas.mk')
+
+    def test_wishlist_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/wishlist/', {'fields': 'ad.title,ad.car_details'})
+        item = response.data['results'][0]
+        self.assertEqual(item, {'ad': {'title': 'Car 4', 'car_details': item['ad']['car_details']}})
+        self.assertEqual(item['ad']['car_details']['manufacturer'], 'Audi')
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn('description', queries[-1]['sql'])
+
+
+@override_settings(REQUEST_METRICS_TOKEN='secret', REQUEST_METRICS_HEADER=False)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        # Drop what earlier tests left in this process.
+        aggregator.flush()
+        reset_metrics()
+        get_response_cache().clear()
+        create_ad(create_user())
+        self.client = APIClient()
+
+    def test_counters(self):
+        for _ in range(3):
+            self.client.get('/ads/')
+        aggregator.flush()
+        counters = read_metrics()['GET:/ads/']
+        self.assertEqual(counters['requests'], 3)
+        self.assertGreater(counters['queries'], 0)
+        self.assertGreater(counters['bytes'], 0)
+        self.assertEqual(sum(counters[f'bucket_{bound}'] for bound in (*LATENCY_BUCKETS_MS, 'inf')), 3)
+
+        # Later flushes add to the stored counters.
+        self.client.get('/ads/')
+        aggregator.flush()
+        self.assertEqual(read_metrics()['GET:/ads/']['requests'], 4)
+
+    def test_server_timing_is_opt_in(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/choices/'))
+        self.assertNotIn('Server-Timing', self.client.get('/api/choices/', HTTP_X_REQUEST_METRICS='guess'))
+        response = self.client.get('/ads/', HTTP_X_REQUEST_METRICS='secret')
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries", serializer;dur=[\d.]+, total;dur=[\d.]+$')
+        with override_settings(REQUEST_METRICS_HEADER=True):
+            self.assertIn('Server-Timing', self.client.get('/api/choices/'))
+
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+            'responses': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        }):
+            self.client.get('/ads/')
+            metrics = RequestMetrics()
+            metrics.statements['SELECT * FROM "oglas_carad" WHERE "id" = %s'] = 10
+            aggregator.record('GET:/ads/similar/<int:ad_id>/', 0.3, metrics, 100)
+            aggregator.flush()
+
+            out = StringIO()
+            call_command('request_metrics', '--json', stdout=out)
+            rows = {row['route']: row for row in json.loads(out.getvalue())}
+            self.assertEqual(rows['GET:/ads/']['requests'], 1)
+            self.assertEqual(rows['GET:/ads/similar/<int:ad_id>/']['p95'], 500)
+            self.assertEqual(rows['GET:/ads/similar/<int:ad_id>/']['n_plus_one'], 1)
+
+            out = StringIO()
+            call_command('request_metrics', '--reset', stdout=out)
+            self.assertIn('N+1 suspects:\nGET:/ads/similar/<int:ad_id>/: 1 requests, e.g. 10x SELECT', out.getvalue())
+            self.assertEqual(read_metrics(), {})
+
+    def test_report_needs_shared_cache(self):
+        with self.assertRaisesMessage(CommandError, 'Set REDIS_URL'):
+            call_command('request_metrics', stdout=StringIO())
+
+
+class AccessTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        create_car_ad(self.user)
+        self.client = APIClient()
+
+    def get_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Basic ' + base64.b64encode(b'user@oglas.mk:secret').decode())
+        response = self.client.post('/auth/access-token/')
+        self.client.credentials()
+        return response.data['access_token']
+
+    def test_bearer_requests_skip_user_query(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.get_token()}')
+        # Same as a forced login: one query for the page count and one for the page.
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/user-ads/').status_code, 200)
+
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        self.assertEqual(self.client.get('/user-info/').data['first_name'], 'Renamed')
+
+    def test_rejected_tokens(self):
+        token = self.get_token()
+        with override_settings(ACCESS_TOKEN_LIFETIME=-1):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(self.client.get('/user-info/').status_code, 401)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token[:-1]}x')
+        self.assertEqual(self.client.get('/user-info/').status_code, 401)
+        # An access token can't be traded for a fresh one.
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.post('/auth/access-token/').status_code, 401)
+
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertEqual(self.client.get('/user-info/').status_code, 401)
+
+    def test_api_token_cached_until_logout(self):
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.client.get('/user-info/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/user-info/').status_code, 200)
+
+        token.delete()
+        self.assertEqual(self.client.get('/user-info/').status_code, 401)
+
+
+class WishlistMembershipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.ads = [create_ad(self.user, title=f'Ad {i}') for i in range(3)]
+
+    def test_add_once(self):
+        ad_id = self.ads[0].id
+        self.assertEqual(self.client.post('/wishlist/add/', {'ad_id': ad_id}).status_code, 201)
+        self.assertEqual(self.client.post('/wishlist/add/', {'ad_id': ad_id}).status_code, 400)
+        self.assertEqual(Wishlist.objects.filter(user=self.user, ad_id=ad_id).count(), 1)
+
+    def test_membership(self):
+        for ad in self.ads[:2]:
+            Wishlist.objects.create(user=self.user, ad=ad)
+        ids = ','.join(str(ad.id) for ad in reversed(self.ads))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/wishlist/contains/', {'ids': ids}).data['ids'],
+                             [self.ads[1].id, self.ads[0].id])
+        with self.assertNumQueries(0):
+            self.client.get('/wishlist/contains/', {'ids': ids})
+
+        self.client.delete(f'/wishlist/remove/{self.ads[1].id}/')
+        self.ads[0].delete()
+        self.assertEqual(self.client.get('/wishlist/contains/', {'ids': ids}).data['ids'], [])
+        self.assertEqual(self.client.get('/wishlist/contains/', {'ids': 'x'}).status_code, 400)
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        owner = create_user()
+        self.ad = create_ad(owner, is_featured=True)
+        for i in range(3):
+            create_ad(owner, title=f'Ad {i}', is_featured=True)
+            create_car_ad(owner, title=f'Car {i}', price=1000 * i)
+
+    def get_both(self, path, params=None):
+        get_response_cache().clear()
+        expected = self.client.get(path, params)
+        get_response_cache().clear()
+        with override_settings(ROOT_URLCONF='oglasBE.asgi_urls'):
+            response = async_to_sync(self.async_client.get)(path, params)
+        return expected, response
+
+    def test_same_responses(self):
+        requests = [
+            ('/ads/', {}),
+            ('/ads/', {'category': 'car', 'sort': 'priceLowToHigh', 'size': 2, 'page': 2}),
+            ('/ads/', {'pagination': 'cursor', 'size': 2, 'count': 'exact'}),
+            ('/ads/', {'page': 99}),
+            (f'/ad/{self.ad.id}/', None),
+            ('/ad/0/', None),
+            (f'/ads/similar/{self.ad.id}/', None),
+            ('/ads/similar/0/', None),
+        ]
+        for path, params in requests:
+            with self.subTest(path=path, params=params):
+                expected, response = self.get_both(path, params)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.json(), expected.json())
+
+    def test_same_featured_slate(self):
+        # Clearing the cache would reshuffle the slate.
+        expected = self.client.get('/ads/featured/')
+        with override_settings(ROOT_URLCONF='oglasBE.asgi_urls'):
+            response = async_to_sync(self.async_client.get)('/ads/featured/')
+        self.assertEqual(response.json(), expected.json())
+
+    def test_not_modified(self):
+        path = f'/ad/{self.ad.id}/'
+        with override_settings(ROOT_URLCONF='oglasBE.asgi_urls'):
+            etag = async_to_sync(self.async_client.get)(path)['ETag']
+            response = async_to_sync(self.async_client.get)(path, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(path, headers={'If-None-Match': etag}).status_code, 304)
+
+
+class AdCursorPaginationTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        owner = create_user()
+        today = timezone.now().date()
+        # Few distinct prices and dates, so most pages end inside a run of equal sort keys.
+        for i in range(14):
+            ad = create_ad(owner, title=f'Ad {i}', price=[100, 200, 300][i % 3])
+            Ad.objects.filter(id=ad.id).update(created_at=today - timedelta(days=i % 2))
+        rebuild_listings()
+        self.client = APIClient()
+
+    def walk(self, params):
+        ids, url, params = [], '/ads/', {'pagination': 'cursor', 'size': 4, **params}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ids += [ad['id'] for ad in response.data['results']]
+            url, params = response.data['next'], None
+        return ids
+
+    def test_walks_every_ordering(self):
+        for sort, ordering in {**AD_SORT_ORDERINGS, None: ('-id',)}.items():
+            with self.subTest(sort=sort):
+                expected = list(Ad.objects.order_by(*ordering).values_list('id', flat=True))
+                self.assertEqual(self.walk({'sort': sort} if sort else {}), expected)
+
+        # Search results are paginated as rows of the ads themselves.
+        expected = list(Ad.objects.order_by('-id').values_list('id', flat=True))
+        self.assertEqual(self.walk({'search': 'Ad', 'sort': 'priceLowToHigh'}),
+                         list(Ad.objects.order_by('price', 'id').values_list('id', flat=True)))
+        self.assertEqual(self.walk({'search': 'Ad'}), expected)
+
+    def test_invalid_cursor(self):
+        def encode(position):
+            return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+        for cursor in ('garbage', encode(['100', 'x']), encode({'a': 1}), encode(['not a date', 1])):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/ads/', {'pagination': 'cursor', 'sort': 'newest', 'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+        response = self.client.get('/ads/', {'pagination': 'cursor', 'sort': 'priceLowToHigh',
+                                             'cursor': encode(['cheap', 1])})
+        self.assertEqual(response.status_code, 404)
+
+    def test_count_modes(self):
+        def count(mode):
+            return self.client.get('/ads/', {'pagination': 'cursor', 'count': mode}).data['count']
+
+        self.assertIsNone(self.client.get('/ads/', {'pagination': 'cursor'}).data['count'])
+        self.assertEqual(count('exact'), 14)
+        self.assertEqual(count('approx'), 14)
+        self.assertEqual(count('cached'), 14)
+
+        create_ad(Ad.objects.first().owner)
+        self.assertEqual(count('exact'), 15)
+        # Served from the count cache until it expires.
+        self.assertEqual(count('cached'), 14)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = create_user()
+        self.house = create_ad(self.user, title='House', category='house')
+        self.car = create_car_ad(self.user, title='Golf')
+        self.client = APIClient()
+
+    def assertCached(self, params, cached=True):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/ads/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries) == 0, cached, params)
+        return response.data['results']
+
+    def test_hits_and_misses(self):
+        self.assertCached({'sort': 'newest'}, cached=False)
+        self.assertCached({'sort': 'newest'})
+        # Normalized parameters share the entry, empty ones are dropped.
+        self.assertCached({'sort': 'newest', 'location': ''})
+        self.assertCached({'sort': 'oldest'}, cached=False)
+        self.assertEqual(self.client.get('/api/choices/').status_code, 200)
+
+        admin = create_user('admin@oglas.mk')
+        admin.is_staff = True
+        admin.save()
+        self.client.force_authenticate(admin)
+        stats = self.client.get('/api/cache-stats/').data
+        self.assertEqual(stats['ad-list'], {'hits': 2, 'misses': 2})
+        self.assertEqual(stats['choices']['misses'], 1)
+
+    def test_cache_stats_is_admin_only(self):
+        self.assertIn(self.client.get('/api/cache-stats/').status_code, (401, 403))
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/cache-stats/').status_code, 403)
+
+    def test_invalidated_per_category(self):
+        for category in ('car', 'house', 'general'):
+            self.assertCached({'category': category}, cached=False)
+        self.assertCached({}, cached=False)
+
+        create_ad(self.user, title='Flat', category='house')
+        self.assertCached({'category': 'car'})
+        self.assertCached({'category': 'general'})
+        self.assertEqual(len(self.assertCached({'category': 'house'}, cached=False)), 2)
+        self.assertEqual(len(self.assertCached({}, cached=False)), 3)
+
+        # Moving an ad invalidates the category it left too.
+        self.house.category = 'general'
+        self.house.save()
+        self.assertCached({'category': 'car'})
+        self.assertEqual(len(self.assertCached({'category': 'house'}, cached=False)), 1)
+        self.assertEqual(len(self.assertCached({'category': 'general'}, cached=False)), 1)
+
+    def test_featured_namespace(self):
+        featured = get_generations([FEATURED_NAMESPACE])
+        self.house.title = 'Renamed'
+        self.house.save()
+        self.assertEqual(get_generations([FEATURED_NAMESPACE]), featured)
+        self.house.is_featured = True
+        self.house.save()
+        self.assertNotEqual(get_generations([FEATURED_NAMESPACE]), featured)
+
+    def test_views_invalidate(self):
+        self.client.force_authenticate(self.user)
+        self.assertCached({'category': 'house'}, cached=False)
+        response = self.client.put(f'/ad/edit/{self.house.id}/', {'title': 'Villa'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([ad['title'] for ad in self.assertCached({'category': 'house'}, cached=False)], ['Villa'])
+
+        self.assertEqual(self.client.delete(f'/ad/delete/{self.house.id}/').status_code, 204)
+        self.assertEqual(self.assertCached({'category': 'house'}, cached=False), [])
+
+        response = self.client.post('/ad/add/', {'title': 'Cottage', 'description': 'Description', 'price': 10,
+                                                 'ad_type': 'sale', 'location': 'Ohrid', 'category': 'house'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([ad['title'] for ad in self.assertCached({'category': 'house'}, cached=False)], ['Cottage'])
+
+    def test_owner_changes(self):
+        users = get_generations([USERS_NAMESPACE])
+        self.assertCached({}, cached=False)
+
+        # Nothing an ad shows of its owner.
+        self.user.is_verified = False
+        self.user.set_password('changed')
+        self.user.save()
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        create_user('other@oglas.mk')
+        self.assertEqual(get_generations([USERS_NAMESPACE]), users)
+        self.assertCached({})
+
+        self.user.last_name = 'Renamed'
+        self.user.save()
+        self.assertNotEqual(get_generations([USERS_NAMESPACE]), users)
+        results = self.assertCached({}, cached=False)
+        self.assertEqual({ad['owner']['last_name'] for ad in results}, {'Renamed'})
+
+
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = create_user()
+        self.ad = create_ad(self.user)
+        self.client = APIClient()
+
+    def assertNotModified(self, path, params=None):
+        etag = self.client.get(path, params)['ETag']
+        self.assertEqual(self.client.get(path, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        return etag
+
+    def test_ad_details(self):
+        path = f'/ad/{self.ad.id}/'
+        etag = self.assertNotModified(path)
+        self.assertEqual(self.client.get(path, HTTP_IF_MATCH=etag).status_code, 200)
+
+        self.ad.title = 'Renamed'
+        self.ad.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(path, HTTP_IF_MATCH=etag).status_code, 412)
+
+    def test_concurrent_saves_bump_version_twice(self):
+        first, second = Ad.objects.get(id=self.ad.id), Ad.objects.get(id=self.ad.id)
+        first.title = 'First'
+        first.save()
+        second.title = 'Second'
+        second.save()
+        self.assertEqual(second.version, self.ad.version + 2)
+        self.assertEqual(Ad.objects.get(id=self.ad.id).version, self.ad.version + 2)
+
+    def test_version_stays_out_of_payloads(self):
+        car = create_car_ad(self.user)
+        Wishlist.objects.create(user=self.user, ad=car)
+        self.client.force_authenticate(self.user)
+        payloads = [
+            self.client.get(f'/ad/{car.id}/').data,
+            *self.client.get('/ads/').data['results'],
+            *self.client.get('/ads/', {'search': 'Car'}).data['results'],
+            *(item['ad'] for item in self.client.get('/wishlist/').data['results']),
+            *AdListing.objects.values_list('payload', flat=True),
+        ]
+        self.assertEqual(len(payloads), 7)
+        self.assertFalse([payload for payload in payloads if 'version' in payload])
+
+    def test_ad_list_and_facets(self):
+        for path in ('/ads/', '/ads/facets/'):
+            etag = self.assertNotModified(path, {'location': 'Skopje'})
+            # Only data changes move the validators, not the clock.
+            with mock.patch('time.time', return_value=time.time() + 3600):
+                self.assertEqual(self.client.get(path, {'location': 'Skopje'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        etag = self.client.get('/ads/')['ETag']
+        create_ad(self.user, title='New')
+        self.assertEqual(self.client.get('/ads/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_user_endpoints(self):
+        self.client.force_authenticate(self.user)
+        Wishlist.objects.create(user=self.user, ad=self.ad)
+        for path in ('/wishlist/', '/user-info/', '/api/choices/'):
+            self.assertNotModified(path)
+
+        etag = self.client.get('/wishlist/')['ETag']
+        self.ad.save()
+        self.assertEqual(self.client.get('/wishlist/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_wishlist_changes(self):
+        self.client.force_authenticate(self.user)
+        ads = [create_ad(self.user, title=f'Ad {i}') for i in range(3)]
+        items = [Wishlist.objects.create(user=self.user, ad=ad) for ad in ads[:2]]
+        # Edits of ads below the highest version count too.
+        ads[1].save()
+        ads[1].save()
+
+        etag = self.client.get('/wishlist/')['ETag']
+        for change in (lambda: ads[0].save(), lambda: items[0].delete(),
+                       lambda: (items[1].delete(), Wishlist.objects.create(user=self.user, ad=ads[2]))):
+            change()
+            new_etag = self.client.get('/wishlist/')['ETag']
+            self.assertNotEqual(new_etag, etag)
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get('/wishlist/', HTTP_IF_NONE_MATCH=new_etag).status_code, 304)
+            etag = new_etag
+
+
+class BulkImportExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, content):
+        return self.client.post('/ads/import/', {'file': SimpleUploadedFile(name, content.encode())},
+                                format='multipart')
+
+    def test_csv_import_reports_row_errors(self):
+        content = (
+            'title,description,price,ad_type,location,category,image_urls,manufacturer,year,mileage,fuel_type,color,car_type\n'
+            'Golf,Good car,4500,sale,Skopje,car,https://a/1.jpg https://a/2.jpg,Volkswagen,2012,150000,Diesel,Black,Hatchback\n'
+            'Flat,Near center,300,rent,Ohrid,house,,,,,,,\n'
+            'Broken,No price,,sale,Skopje,general,,,,,,,\n'
+            'Bad car,Year missing,1000,sale,Skopje,car,,Audi,,1,Diesel,Black,Sedan\n'
+        )
+        # Plus one read of the new ads and one upsert into the AdListing read model.
+        with self.assertNumQueries(9):
+            response = self.upload('ads.csv', content)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 2))
+        self.assertEqual([(error['row'], list(error['errors'])) for error in response.data['errors']],
+                         [(3, ['price']), (4, ['year'])])
+        car = CarAd.objects.get(owner=self.user)
+        self.assertEqual((car.manufacturer, car.image_urls), ('Volkswagen', ['https://a/1.jpg', 'https://a/2.jpg']))
+
+    def test_export_round_trips_through_import(self):
+        create_ad(self.user, title='Plain', image_urls=['https://a/1.jpg'])
+        create_car_ad(self.user, title='Car')
+        create_ad(create_user('other@oglas.mk'), title='Not mine')
+
+        for file_format in ('csv', 'jsonl'):
+            with self.subTest(file_format=file_format):
+                response = self.client.get(f'/user-ads/export/{file_format}/')
+                self.assertTrue(response.streaming)
+                content = b''.join(response.streaming_content).decode()
+
+                importer = create_user(f'importer-{file_format}@oglas.mk')
+                path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), f'ads.{file_format}')
+                with open(path, 'w') as f:
+                    f.write(content)
+                call_command('import_ads', path, owner=importer.email, stdout=StringIO())
+                self.assertEqual(
+                    sorted(Ad.objects.filter(owner=importer).values_list('title', 'category', 'image_urls')),
+                    [('Car', 'car', []), ('Plain', 'general', ['https://a/1.jpg'])])
+                self.assertTrue(CarAd.objects.filter(owner=importer, manufacturer='Audi').exists())
+
+    def test_site_export_needs_admin(self):
+        self.assertEqual(self.client.get('/ads/export/csv/').status_code, 403)
+
+    def test_bulk_create_car_ads(self):
+        car_ads = [CarAd(owner=self.user, title=f'Car {i}', description='Description', price=1000 * i,
+                         ad_type='sale', location='Skopje', category='car', image_urls=[], manufacturer='Audi',
+                         year=2010 + i, mileage=i, fuel_type='Diesel', color='Black', car_type='Sedan')
+                   for i in range(5)]
+        # Three batches into each table, in a savepoint.
+        with self.assertNumQueries(8):
+            created = bulk_create_car_ads(car_ads, batch_size=2)
+        self.assertEqual([car_ad.ad_ptr_id for car_ad in created], [car_ad.id for car_ad in car_ads])
+        self.assertEqual(list(CarAd.objects.order_by('id').values_list('id', 'title', 'year')),
+                         [(car_ad.id, f'Car {i}', 2010 + i) for i, car_ad in enumerate(car_ads)])
+        # No signals, so no listings until they are refreshed.
+        self.assertFalse(AdListing.objects.exists())
+
+
+class AdListingTests(TestCase):
+    def setUp(self):
+        self.owner = create_user()
+        self.ad = create_ad(self.owner, title='Flat')
+        self.car = create_car_ad(self.owner, title='Golf')
+
+    def test_listings_follow_writes(self):
+        self.assertEqual(AdListing.objects.get(id=self.car.id).payload, self.client.get(f'/ad/{self.car.id}/').json())
+
+        self.car.mileage = 1
+        self.car.save()
+        self.assertEqual(AdListing.objects.get(id=self.car.id).mileage, 1)
+
+        self.owner.first_name = 'Renamed'
+        self.owner.save()
+        self.assertEqual({listing.payload['owner']['first_name'] for listing in AdListing.objects.all()}, {'Renamed'})
+
+        self.ad.delete()
+        self.assertEqual(list(AdListing.objects.values_list('id', flat=True)), [self.car.id])
+
+    def test_feed_reads_one_table(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/ads/', {'category': 'car', 'manufacturer': 'Audi'})
+        self.assertEqual([ad['title'] for ad in response.json()['results']], ['Golf'])
+
+    def test_rebuild(self):
+        Ad.objects.filter(id=self.ad.id).update(title='Updated')
+        AdListing.objects.filter(id=self.car.id).delete()
+        AdListing.objects.create(id=0, owner=self.owner, category='general', location='Skopje', ad_type='sale',
+                                 price=1, created_at=self.ad.created_at, is_active=True, is_featured=False, payload={})
+
+        call_command('rebuild_listings', stdout=StringIO())
+        self.assertEqual(dict(AdListing.objects.values_list('id', 'payload__title')),
+                         {self.ad.id: 'Updated', self.car.id: 'Golf'})
+
+    def test_migration_asks_for_rebuild(self):
+        check_listings = import_module('oglas.migrations.0012_check_adlistings').check_listings
+        with redirect_stdout(StringIO()) as stdout:
+            check_listings(django_apps, None)
+        self.assertEqual(stdout.getvalue(), '')
+
+        # Ads that existed before the read model did.
+        AdListing.objects.filter(id=self.car.id).delete()
+        with redirect_stdout(StringIO()) as stdout:
+            check_listings(django_apps, None)
+        self.assertIn('rebuild_listings', stdout.getvalue())
+        self.assertFalse(AdListing.objects.filter(id=self.car.id).exists())
+
+
+@skipUnless(find_spec('numpy'), 'Needs NumPy')
+class SimilarAdsTests(TestCase):
+    def setUp(self):
+        owner = create_user()
+        self.car = create_car_ad(owner, manufacturer='Audi', year=2012, mileage=150000, price=9000)
+        self.close = create_car_ad(owner, manufacturer='Audi', year=2013, mileage=140000, price=9500)
+        self.cheap = create_car_ad(owner, manufacturer='Audi', year=2012, mileage=150000, price=1000)
+        self.other = create_car_ad(owner, manufacturer='BMW', year=2001, mileage=300000, price=9000, location='Ohrid')
+        self.plain = create_ad(owner)
+
+    def similar_ids(self, ad):
+        return [item['id'] for item in self.client.get(f'/ads/similar/{ad.id}/').data]
+
+    def test_ranked_by_score(self):
+        # Before the first run the newest ads of the category stand in.
+        self.assertEqual(self.similar_ids(self.car), [self.other.id, self.cheap.id, self.close.id])
+
+        call_command('compute_similar_ads', stdout=StringIO())
+        self.assertFalse(AdListing.objects.filter(similar_stale=True).exists())
+        self.assertEqual(self.similar_ids(self.car), [self.close.id, self.cheap.id, self.other.id])
+        self.assertEqual(self.similar_ids(self.plain), [])
+
+    def test_refreshes_changed_ads(self):
+        call_command('compute_similar_ads', stdout=StringIO())
+        self.cheap.delete()
+        self.close.manufacturer = 'BMW'
+        self.close.save()
+        self.assertEqual(list(AdListing.objects.filter(similar_stale=True).values_list('id', flat=True)),
+                         [self.close.id])
+        self.assertEqual(self.similar_ids(self.car), [self.close.id, self.other.id])
+
+        call_command('compute_similar_ads', stdout=StringIO())
+        self.assertEqual(AdListing.objects.get(id=self.close.id).similar_ids, [self.car.id, self.other.id])
+
+
+class AdFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        self.user = create_user()
+        self.ad = create_ad(self.user, title='Flat', is_featured=True)
+        self.car = create_car_ad(self.user, title='Golf', is_featured=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, path, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data, ' '.join(query['sql'] for query in queries)
+
+    def test_ad_list(self):
+        data, sql = self.get('/ads/', {'fields': 'id,title,owner.email', 'sort': 'oldest'})
+        self.assertEqual(data['results'], [
+            {'id': self.ad.id, 'title': 'Flat', 'owner': {'email': 'user@oglas.mk'}},
+            {'id': self.car.id, 'title': 'Golf', 'owner': {'email': 'user@oglas.mk'}},
+        ])
+
+        data, sql = self.get('/ads/', {'exclude': 'description,owner,image_urls', 'search': 'Golf', 'category': 'car'})
+        self.assertNotIn('description', data['results'][0])
+        self.assertEqual(data['results'][0]['car_details']['manufacturer'], 'Audi')
+        self.assertNotIn('"description"', sql.split('WHERE')[0])
+
+    @skipUnless(connection.vendor == 'postgresql', 'The payload is projected in SQL on PostgreSQL only')
+    def test_ad_list_projects_payload_in_sql(self):
+        data, sql = self.get('/ads/', {'fields': 'id,is_featured,car_details', 'sort': 'oldest'})
+        self.assertEqual(data['results'][0], {'id': self.ad.id, 'is_featured': True, 'car_details': None})
+        # Only keys of the payload are selected, never the whole column.
+        self.assertIn('JSONB_BUILD_OBJECT', sql)
+        self.assertNotRegex(sql, r'"oglas_adlisting"\."payload"(,| FROM)')
+
+    def test_user_ads(self):
+        data, sql = self.get('/user-ads/', {'fields': 'id,title'})
+        self.assertEqual([ad.keys() for ad in data['results']], [{'id', 'title'}] * 2)
+        self.assertNotIn('description', sql)
+        self.assertNotIn('oglas_customuser', sql)
+
+    def test_featured_and_similar(self):
+        data, sql = self.get('/ads/featured/', {'fields': 'id'})
+        self.assertEqual(sorted(ad['id'] for ad in data), [self.ad.id, self.car.id])
+
+        other = create_ad(self.user, title='House')
+        data, sql = self.get(f'/ads/similar/{self.ad.id}/', {'exclude': 'owner,car_details,description'})
+        self.assertEqual([(ad['id'], 'owner' in ad, 'title' in ad) for ad in data], [(other.id, False, True)])
+
+
+class FastListTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = create_user()
+        self.user.date_of_birth = timezone.now().date()
+        self.user.save()
+        create_ad(self.user, title='Flat', price=Decimal('1234.5'), image_urls=['a.jpg', None])
+        create_car_ad(self.user, title='Golf')
+        # A car ad without its CarAd row.
+        create_ad(self.user, title='Broken', category='car')
+
+    def test_rows_match_ad_serializer(self):
+        for ads in (Ad.objects.order_by('id'), CarAd.objects.order_by('id')):
+            expected = AdSerializer(AdSerializer.setup_eager_loading(ads), many=True).data
+            rows = AdRowSerializer().setup_sparse_loading(ads)
+            # Same bytes, so the same values and the same key order.
+            self.assertEqual(JSONRenderer().render(AdRowSerializer(rows, many=True).data),
+                             JSONRenderer().render(expected))
+
+    def test_list_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        expected = AdSerializer(AdSerializer.setup_eager_loading(Ad.objects.order_by('-id')), many=True).data
+        response = client.get('/user-ads/')
+        self.assertEqual(sorted(response.data['results'], key=lambda ad: -ad['id']), expected)
+
+        # The cursor is read from the rows too.
+        response = client.get('/ads/', {'search': 'Description', 'pagination': 'cursor', 'size': 1})
+        self.assertEqual(response.data['results'], expected[:1])
+        response = client.get(response.data['next'])
+        self.assertEqual(response.data['results'], expected[1:2])
+
+    def test_renderer_matches_json_renderer(self):
+        data = {'price': Decimal('10.50'), 'date': timezone.now().date(), 'time': timezone.now(),
+                'lazy': gettext_lazy('Invalid token.'), 'text': 'Štip \u2028\u2029', 1: [None, True, 1.5]}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+
+
+class AdFacetsTests(TestCase):
+    def setUp(self):
+        owner = create_user()
+        create_ad(owner, location='Ohrid', price=300)
+        create_car_ad(owner, manufacturer='Audi', year=2012, price=4500)
+        create_car_ad(owner, manufacturer='Audi', year=2019, price=12000, location='Ohrid')
+        create_car_ad(owner, manufacturer='BMW', year=2003, price=3000)
+
+    def test_counts_leave_out_own_filter(self):
+        # Seven facets and one aggregate for the three histograms.
+        with self.assertNumQueries(8):
+            response = self.client.get('/ads/facets/', {'category': 'car', 'manufacturer': 'Audi', 'yearFrom': 2010})
+        facets, histograms = response.data['facets'], response.data['histograms']
+        self.assertEqual(facets['manufacturer'], [{'value': 'Audi', 'count': 2}])
+        self.assertEqual(facets['location'], [{'value': 'Ohrid', 'count': 1}, {'value': 'Skopje', 'count': 1}])
+        # Without the category the car filters don't apply either.
+        self.assertEqual(facets['category'], [{'value': 'car', 'count': 3}, {'value': 'general', 'count': 1}])
+        self.assertEqual([bucket['count'] for bucket in histograms['year']], [0, 0, 0, 1, 1, 0])
+        self.assertEqual([(bucket['from'], bucket['count']) for bucket in histograms['price'] if bucket['count']],
+                         [(2500, 1), (10000, 1)])
+
+    def test_plain_ads_have_no_car_facets(self):
+        response = self.client.get('/ads/facets/', {'location': 'Ohrid'})
+        self.assertEqual(set(response.data['facets']), {'location', 'category', 'ad_type'})
+        self.assertEqual(response.data['facets']['category'], [{'value': 'car', 'count': 1}, {'value': 'general', 'count': 1}])
+        self.assertEqual(sum(bucket['count'] for bucket in response.data['histograms']['price']), 2)
+
+    def test_invalid_filters(self):
+        for params in ({'priceFrom': 'abc'}, {'category': 'car', 'yearFrom': 'x'}, {'fromDate': '2024-13-01'}):
+            with self.subTest(params=params):
+                response = self.client.get('/ads/facets/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(set(response.data), set(params) - {'category'})
+        # Blank filters are left out, like the list does.
+        self.assertEqual(self.client.get('/ads/facets/', {'priceFrom': '', 'yearTo': ''}).status_code, 200)
+
+
+class StorageClientTests(TestCase):
+    @override_settings(IMAGE_STORAGE_CLIENT='oglas.storage.InMemoryStorageClient')
+    def test_client_follows_settings(self):
+        client = get_storage_client()
+        self.assertIsInstance(client, InMemoryStorageClient)
+        self.assertIs(get_storage_client(), client)
+
+        with self.settings(IMAGE_STORAGE_CLIENT='oglas.storage.LocalFileSystemStorageClient'):
+            self.assertIsInstance(get_storage_client(), LocalFileSystemStorageClient)
+        self.assertIsNot(get_storage_client(), client)
+        self.assertIsInstance(get_storage_client(), InMemoryStorageClient)
+
+    @override_settings(IMAGE_STORAGE_CLIENT='oglas.storage.FirebaseStorageClient',
+                       FIREBASE_CREDENTIALS='/nonexistent/credentials.json')
+    def test_firebase_connects_on_first_use(self):
+        with mock.patch.object(FirebaseStorageClient, 'connect') as connect:
+            client = get_storage_client()
+            self.assertIsInstance(client, FirebaseStorageClient)
+            connect.assert_not_called()
+
+            client.upload('images/a.jpg', b'data')
+            client.exists('images/a.jpg')
+            connect.assert_called_once()
+            connect.return_value.blob.return_value.upload_from_string.assert_called_once_with(b'data')
+
+    def test_local_file_system(self):
+        with tempfile.TemporaryDirectory() as root, self.settings(
+                IMAGE_STORAGE_CLIENT='oglas.storage.LocalFileSystemStorageClient', IMAGE_STORAGE_ROOT=root):
+            client = get_storage_client()
+            client.upload('images/a.jpg', b'data')
+            self.assertTrue(client.exists('images/a.jpg'))
+            self.assertEqual((client.root / 'images/a.jpg').read_bytes(), b'data')
+
+            client.delete('images/a.jpg')
+            client.delete('images/a.jpg')
+            self.assertFalse(client.exists('images/a.jpg'))
+            with self.assertRaises(SuspiciousFileOperation):
+                client.upload('../a.jpg', b'data')
+
+
+@override_settings(IMAGE_STORAGE_CLIENT='oglas.storage.InMemoryStorageClient')
+class ImageDeletionTests(TestCase):
+    def setUp(self):
+        self.bucket = get_storage_client()
+        self.bucket.blobs.clear()
+        self.user = create_user()
+
+    def create_ad_with_images(self, count):
+        urls = []
+        for i in range(count):
+            name = f'images/{self.user.id}-{i}.jpg'
+            self.bucket.upload(name, b'')
+            urls.append(f'https://firebasestorage.googleapis.com/v0/b/oglas/o/images%2F{self.user.id}-{i}.jpg?alt=media')
+        return create_ad(self.user, image_urls=urls)
+
+    def test_delete_ad_queues_images(self):
+        self.create_ad_with_images(3).delete()
+        self.assertEqual(PendingImageDeletion.objects.count(), 3)
+        self.assertEqual(len(self.bucket.blobs), 3)
+
+        call_command('delete_images', stdout=StringIO())
+        self.assertEqual(PendingImageDeletion.objects.count(), 0)
+        self.assertEqual(self.bucket.blobs, {})
+
+    def test_user_cascade_queues_images(self):
+        self.create_ad_with_images(2)
+        self.user.delete()
+        call_command('delete_images', stdout=StringIO())
+        self.assertEqual(self.bucket.blobs, {})
+
+    def test_failures_are_retried_later(self):
+        self.create_ad_with_images(1).delete()
+        with mock.patch.object(self.bucket, 'delete', side_effect=ConnectionError('timeout')):
+            call_command('delete_images', stdout=StringIO(), stderr=StringIO())
+        item = PendingImageDeletion.objects.get()
+        self.assertEqual(item.attempts, 1)
+        self.assertEqual(item.last_error, 'timeout')
+
+
+class BiddingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = create_user()
+        self.bidder = create_user('bidder@oglas.mk')
+        self.auction = create_auction(self.owner)
+        self.client.force_authenticate(self.bidder)
+
+    def bid(self, amount):
+        return self.client.post(f'/auctions/{self.auction.id}/bid/', {'bid_amount': amount}, format='json')
+
+    def test_bids_must_increase(self):
+        self.assertEqual(self.bid('99.00').status_code, 409)
+        self.assertEqual(self.bid('100.00').status_code, 201)
+        response = self.bid('100.00')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['current_price'], Decimal('100.00'))
+        self.assertEqual(self.bid('150.00').status_code, 201)
+
+        self.auction.refresh_from_db()
+        self.assertEqual(self.auction.current_price, Decimal('150.00'))
+        self.assertEqual(list(Bid.objects.filter(is_highest_bid=True).values_list('bid_amount', flat=True)),
+                         [Decimal('150.00')])
+
+    def test_rejects_owner_and_ended_auctions(self):
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.bid('200.00').status_code, 409)
+        self.client.force_authenticate(self.bidder)
+        Auction.objects.filter(id=self.auction.id).update(end_time=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.bid('200.00').status_code, 409)
+        self.assertEqual(self.client.post('/auctions/0/bid/', {'bid_amount': 1}).status_code, 404)
+
+    def test_rejects_closed_auctions(self):
+        # Closed by close_auctions before its end_time passed, e.g. while the bid waited for the lock.
+        Auction.objects.filter(id=self.auction.id).update(is_closed=True)
+        with self.assertRaises(BidRejected):
+            place_bid(self.auction.id, self.bidder, Decimal('500.00'))
+        self.assertEqual(self.bid('500.00').status_code, 409)
+        self.auction.refresh_from_db()
+        self.assertEqual(self.auction.current_price, Decimal('0.00'))
+        self.assertFalse(Bid.objects.exists())
+
+
+class CloseAuctionsTests(TestCase):
+    def test_closes_expired_auctions(self):
+        owner = create_user()
+        bidders = [create_user(f'bidder{i}@oglas.mk') for i in range(2)]
+        ended = create_auction(owner)
+        unsold = create_auction(owner, end_time=timezone.now() - timedelta(hours=1))
+        running = create_auction(owner)
+        place_bid(ended.id, bidders[0], Decimal(100))
+        place_bid(ended.id, bidders[1], Decimal(120))
+        place_bid(running.id, bidders[0], Decimal(100))
+        Auction.objects.filter(id=ended.id).update(end_time=timezone.now() - timedelta(minutes=1))
+
+        call_command('close_auctions', batch_size=1, stdout=StringIO())
+
+        ended.refresh_from_db()
+        unsold.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual((ended.is_closed, ended.winner), (True, bidders[1]))
+        self.assertEqual((unsold.is_closed, unsold.winner), (True, None))
+        self.assertEqual((running.is_closed, running.winner), (False, None))
+
+
+@override_settings(AUCTION_BROKER='oglas.realtime.InProcessBroker', AUCTION_STREAM_KEEPALIVE=0.01)
+@override_settings(ROOT_URLCONF='oglasBE.asgi_urls')
+class AuctionStreamTests(TestCase):
+    async def test_stream_pushes_bids(self):
+        owner = await sync_to_async(create_user)()
+        bidder = await sync_to_async(create_user)('bidder@oglas.mk')
+        auction = await sync_to_async(create_auction)(owner)
+
+        response = await self.async_client.get(f'/auctions/{auction.id}/stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        self.assertTrue((await anext(events)).startswith(b'event: state\n'))
+        self.assertEqual(await anext(events), b': keepalive\n\n')
+
+        def bid():
+            with self.captureOnCommitCallbacks(execute=True):
+                place_bid(auction.id, bidder, Decimal(150))
+
+        await sync_to_async(bid)()
+        event = await anext(events)
+        self.assertTrue(event.startswith(b'event: bid\n'))
+        self.assertEqual(json.loads(event.split(b'data: ')[1])['current_price'], '150')
+
+        publish_closed([auction.id])
+        self.assertTrue((await anext(events)).startswith(b'event: closed\n'))
+        with self.assertRaises(StopAsyncIteration):
+            await anext(events)
+
+    async def test_missing_auction(self):
+        response = await self.async_client.get('/auctions/0/stream/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_not_routed_under_wsgi(self):
+        auction = create_auction(create_user())
+        with override_settings(ROOT_URLCONF='oglasBE.urls'):
+            self.assertEqual(self.client.get(f'/auctions/{auction.id}/stream/').status_code, 404)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs row level locking')
+class BiddingConcurrencyTests(TransactionTestCase):
+    bidders = 16
+    bids_per_bidder = 25
+
+    def test_parallel_bidders(self):
+        owner = create_user()
+        auction = create_auction(owner)
+        users = [create_user(f'bidder{i}@oglas.mk') for i in range(self.bidders)]
+        accepted, lock = [], threading.Lock()
+
+        def bid(user):
+            rnd = random.Random(user.id)
+            try:
+                for _ in range(self.bids_per_bidder):
+                    amount = Decimal(rnd.randint(100, 10000))
+                    try:
+                        place_bid(auction.id, user, amount)
+                    except BidRejected:
+                        continue
+                    with lock:
+                        accepted.append(amount)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=bid, args=(user,)) for user in users]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        throughput = self.bidders * self.bids_per_bidder / (time.perf_counter() - start)
+
+        auction.refresh_from_db()
+        bids = list(Bid.objects.filter(auction=auction).order_by('id'))
+        self.assertEqual(len(bids), len(accepted))
+        self.assertEqual(auction.current_price, max(accepted))
+        self.assertEqual([bid.bid_amount for bid in bids if bid.is_highest_bid], [max(accepted)])
+        amounts = [bid.bid_amount for bid in bids]
+        self.assertEqual(amounts, sorted(set(amounts)), 'Accepted bids must be strictly increasing')
+        self.assertGreater(throughput, 50, f'Only {throughput:.0f} bids/s')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans are PostgreSQL specific')
+class AdIndexPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = create_user()
+        cities = [city for city, _ in Ad.CITY_CHOICES[1:]]
+        categories = ['general', 'motorcycle', 'house']
+        Ad.objects.bulk_create([
+            Ad(owner=owner, title=f'Ad {i}', description='', price=i % 700, ad_type='sale',
+               location=cities[i % len(cities)], category=categories[i % len(categories)],
+               is_featured=i % 100 == 0)
+            for i in range(5000)
+        ])
+        for i in range(200):
+            create_car_ad(owner, manufacturer=['Audi', 'BMW', 'Toyota', 'Ford'][i % 4], year=1995 + i % 30,
+                          mileage=i * 1000, location=cities[i % len(cities)])
+        rebuild_listings()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE oglas_ad')
+            cursor.execute('ANALYZE oglas_carad')
+            cursor.execute('ANALYZE oglas_adlisting')
+
+    def assertNoSeqScan(self, queryset):
+        # With seq scans disabled the planner still falls back to one when no index applies.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        nodes = [json.loads(queryset.explain(format='json'))[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            self.assertNotEqual(node['Node Type'], 'Seq Scan',
+                                f'Sequential scan on {node.get("Relation Name")} for {queryset.query}')
+            nodes.extend(node.get('Plans', []))
+
+    def test_newest_feed(self):
+        self.assertNoSeqScan(Ad.objects.order_by('-created_at', '-id')[:9])
+
+    def test_price_sort(self):
+        self.assertNoSeqScan(Ad.objects.order_by('-price', '-id')[:9])
+
+    def test_category_location_feed(self):
+        self.assertNoSeqScan(Ad.objects.filter(category='house', location='Ohrid').order_by('-created_at', '-id')[:9])
+
+    def test_category_price_range(self):
+        self.assertNoSeqScan(Ad.objects.filter(category='general', price__gte=100, price__lte=200).order_by('price', 'id')[:9])
+
+    def test_location_feed(self):
+        self.assertNoSeqScan(Ad.objects.filter(location='Bitola').order_by('-created_at', '-id')[:9])
+
+    def test_search(self):
+        self.assertNoSeqScan(search_ads(Ad.objects.all(), 'Ad 123').order_by('-rank', '-id')[:9])
+
+    def test_featured(self):
+        self.assertNoSeqScan(Ad.objects.filter(is_featured=True)[:4])
+
+    def test_listing_feeds(self):
+        self.assertNoSeqScan(AdListing.objects.order_by('-created_at', '-id')[:9])
+        self.assertNoSeqScan(AdListing.objects.filter(category='house', location='Ohrid').order_by('-created_at', '-id')[:9])
+        self.assertNoSeqScan(AdListing.objects.filter(category='general', price__gte=100).order_by('price', 'id')[:9])
+        self.assertNoSeqScan(AdListing.objects.filter(category='car', manufacturer='Audi', year__gte=2010)[:9])
+        self.assertNoSeqScan(AdListing.objects.filter(is_featured=True, is_active=True).order_by('id'))
+
+    def test_car_filters(self):
+        self.assertNoSeqScan(CarAd.objects.filter(manufacturer='Audi', year__gte=2010).order_by('-created_at', '-id')[:9])
+        self.assertNoSeqScan(CarAd.objects.filter(car_type='Sedan', fuel_type='Diesel')[:9])
+        self.assertNoSeqScan(CarAd.objects.filter(year__gte=2000, mileage__lte=50000)[:9])
@@ -1,31 +1,54 @@
+import base64
+import hashlib
 import json
 
 from allauth.account.views import ConfirmEmailView
+from asgiref.sync import sync_to_async
 from dj_rest_auth.registration.views import RegisterView
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Q
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, permissions, status
 from rest_framework import viewsets, request, filters
+from rest_framework.authentication import BasicAuthentication, SessionAuthentication
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import RetrieveAPIView, UpdateAPIView, DestroyAPIView
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.parsers import JSONParser
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 from django_filters import rest_framework as filters
 
-from .models import Ad, Auction, Bid, Wishlist, CarAd
-from .serializer import AdSerializer, AuctionSerializer, BidSerializer, \
+from .authentication import CachedTokenAuthentication, issue_access_token
+from .bidding import BidRejected, place_bid
+from .bulk import export_chunks, get_file_format, import_ads, read_rows, streaming_content
+from .cache import cache_response, ad_list_namespaces, similar_ads_namespaces, get_cache_stats
+from .etags import etag, ad_list_etag, ad_facets_etag, ad_details_etag, wishlist_etag, user_info_etag, choices_etag
+from .featured import get_featured_ads
+from .models import Ad, AdListing, Auction, Bid, Wishlist, CarAd
+from .realtime import auction_events, get_broker
+from .search import search_ads
+from .serializer import AdSerializer, AdListingSerializer, AdRowSerializer, AuctionSerializer, BidSerializer, \
     WishlistSerializer, CustomRegisterSerializer, UserProfileUpdateSerializer, UserInfoSerializer, CarAdSerializer, \
-    EditAdSerializer, EditCarAdSerializer
+    EditAdSerializer, EditCarAdSerializer, PlaceBidSerializer, WishlistCardSerializer, AdFilterParamsSerializer, \
+    get_fieldset
+from .wishlist import get_wishlist_ad_ids
 
 
 # USER API
 @api_view(['GET'])
+@etag(user_info_etag)
 def get_authenticated_user_info(request):
     user = request.user
     serializer = UserInfoSerializer(user)
@@ -34,6 +57,8 @@ def get_authenticated_user_info(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@etag(choices_etag)
+@cache_response('choices')
 def get_choices(request):
     cities = Ad.CITY_CHOICES
     ad_types = Ad.AD_TYPES
@@ -54,6 +79,23 @@ def get_choices(request):
     })
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    return Response(get_cache_stats())
+
+
+class AccessTokenView(APIView):
+    # Trades a password, session or API token for a short lived access token, so the password hash
+    # or token lookup is paid once per token instead of once per request. An access token can't
+    # renew itself.
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication, BasicAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        return Response(issue_access_token(request.user), status=status.HTTP_200_OK)
+
+
 class UserProfileUpdateView(generics.UpdateAPIView):
     serializer_class = UserProfileUpdateSerializer
     permission_classes = [IsAuthenticated]
@@ -85,6 +127,19 @@ class UserAdsPagination(PageNumberPagination):
     page_size_query_param = 'size'
     max_page_size = 1000
 
+    async def apaginate_queryset(self, queryset, request):
+        """paginate_queryset() on the async ORM, raises NotFound for an invalid page like it."""
+        self.request = request
+        paginator = self.django_paginator_class(queryset, self.get_page_size(request))
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        return self.page.object_list
+
     def get_paginated_response(self, data):
         return Response({
             'count': self.page.paginator.count,
@@ -95,6 +150,118 @@ class UserAdsPagination(PageNumberPagination):
         })
 
 
+class AdCursorPagination(BasePagination):
+    """
+    Keyset pagination for the ads feed. The cursor holds the sort value and the id of the
+    last row on the page, so every page is a range scan and never pays for OFFSET.
+    The total count is opt-in through ?count=exact|cached|approx.
+    """
+    page_size = 9
+    page_size_query_param = 'size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    count_cache_timeout = 60
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request)
+        self.count = self.get_count(queryset.order_by())
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request):
+        page_queryset = self.get_page_queryset(queryset, request)
+        self.count = await sync_to_async(self.get_count)(queryset.order_by())
+        return self.set_page([obj async for obj in page_queryset])
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = queryset.query.order_by or ('-id',)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.get_position_filter(*position))
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_sort_field(self):
+        return self.ordering[0].lstrip('-')
+
+    def get_position_filter(self, value, pk):
+        field = self.get_sort_field()
+        op = 'lt' if self.ordering[0].startswith('-') else 'gt'
+        if field == 'id':
+            return Q(**{f'id__{op}': pk})
+        return Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk})
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            return value, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        field = self.get_sort_field()
+        # Whole ads are paginated as .values() rows.
+        if isinstance(obj, dict):
+            value, pk = obj[field], obj['id']
+        else:
+            value, pk = getattr(obj, field), obj.id
+        position = json.dumps([str(value), pk])
+        return base64.urlsafe_b64encode(position.encode('ascii')).decode('ascii')
+
+    def get_count(self, queryset):
+        mode = self.request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'cached':
+            key = 'ad-count:' + hashlib.md5(str(queryset.query).encode('utf-8')).hexdigest()
+            return cache.get_or_set(key, queryset.count, self.count_cache_timeout)
+        if mode == 'approx':
+            return self.get_estimated_count(queryset)
+        return None
+
+    def get_estimated_count(self, queryset):
+        # The planner's row estimate is free compared to COUNT(*) over a large filtered set.
+        if connection.vendor != 'postgresql':
+            return queryset.count()
+        plan = json.loads(queryset.explain(format='json'))
+        return plan[0]['Plan']['Plan Rows']
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
 class UserAdsViewSet(viewsets.ModelViewSet):
     serializer_class = AdSerializer
     permission_classes = [IsAuthenticated]
@@ -102,7 +269,15 @@ class UserAdsViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        return Ad.objects.filter(owner=user)
+        return self.get_serializer().setup_sparse_loading(Ad.objects.filter(owner=user))
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == 'list':
+            fieldset = get_fieldset(self.request.query_params)
+            if not any(fieldset.values()):
+                return AdRowSerializer(*args, **kwargs)
+            kwargs.update(fieldset)
+        return super().get_serializer(*args, **kwargs)
 
 
 # USER API END
@@ -153,89 +328,206 @@ class AdViewSet(viewsets.ModelViewSet):
             CarAd.objects.create(ad_ptr_id=ad.id, **car_data)
 
 
+# The id tiebreaker keeps every ordering total, which keyset pagination relies on.
+AD_SORT_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'priceLowToHigh': ('price', 'id'),
+    'priceHighToLow': ('-price', '-id'),
+}
+
+
+def filter_ad_list(params):
+    """The ads matching the AdListView filters in ``params``, unordered."""
+    category = params.get('category')
+    location = params.get('location')
+    ad_type = params.get('adType')
+    from_date = params.get('fromDate')
+    to_date = params.get('toDate')
+    manufacturer = params.get('manufacturer')
+    car_type = params.get('car_type')
+    fuel_type = params.get('fuelType')
+    color = params.get('color')
+    year_from = params.get('yearFrom')
+    year_to = params.get('yearTo')
+    price_from = params.get('priceFrom')
+    price_to = params.get('priceTo')
+    mileage_from = params.get('mileageFrom')
+    mileage_to = params.get('mileageTo')
+    search_title = params.get('search', '').strip()
+
+    # The feed is read from the flat AdListing read model. Searches need the full-text indexes
+    # of the ad tables, car searches query CarAd so Ad and CarAd predicates land in one flat join.
+    if not search_title:
+        ads = AdListing.objects.all()
+    elif category == 'car':
+        ads = CarAd.objects.all()
+    else:
+        ads = Ad.objects.all()
+
+    if category and category != 'All':
+        ads = ads.filter(category=category)
+    if location and location != 'All':
+        ads = ads.filter(location=location)
+    if ad_type and ad_type != 'All':
+        ads = ads.filter(ad_type=ad_type)
+    if from_date:
+        ads = ads.filter(created_at__gte=from_date)
+    if to_date:
+        ads = ads.filter(created_at__lte=to_date)
+    if price_from:
+        ads = ads.filter(price__gte=price_from)
+    if price_to:
+        ads = ads.filter(price__lte=price_to)
+
+    if category == "car":
+        if manufacturer and manufacturer != 'All':
+            ads = ads.filter(manufacturer=manufacturer)
+        if car_type and car_type != 'All':
+            ads = ads.filter(car_type=car_type)
+        if fuel_type and fuel_type != 'All':
+            ads = ads.filter(fuel_type=fuel_type)
+        if color and color != 'All':
+            ads = ads.filter(color=color)
+        if year_from:
+            ads = ads.filter(year__gte=year_from)
+        if year_to:
+            ads = ads.filter(year__lte=year_to)
+        if mileage_from:
+            ads = ads.filter(mileage__gte=mileage_from)
+        if mileage_to:
+            ads = ads.filter(mileage__lte=mileage_to)
+
+    if search_title:
+        ads = search_ads(ads, search_title)
+    return ads
+
+
+def get_ad_list_queryset(params):
+    ads = filter_ad_list(params)
+    sort_by = params.get('sort')
+    if sort_by in AD_SORT_ORDERINGS:
+        ads = ads.order_by(*AD_SORT_ORDERINGS[sort_by])
+    elif params.get('search', '').strip():
+        ads = ads.order_by('-rank', '-id')
+
+    if ads.model is AdListing:
+        ads = ads.only('id', 'created_at', 'price', 'payload')
+    # Only the columns of the requested fields are loaded, see SparseFieldsetMixin.
+    return get_ad_list_serializer(ads, params).setup_sparse_loading(ads)
+
+
+def get_ad_list_serializer(queryset, params, *args, **kwargs):
+    fieldset = get_fieldset(params)
+    if queryset.model is AdListing:
+        return AdListingSerializer(*args, **fieldset, **kwargs)
+    if not any(fieldset.values()):
+        # Whole ads come straight from .values() rows, see AdRowSerializer.
+        return AdRowSerializer(*args, **kwargs)
+    return AdSerializer(*args, **fieldset, **kwargs)
+
+
+def get_ad_list_paginator(params):
+    if params.get('pagination') == 'cursor':
+        return AdCursorPagination()
+    return UserAdsPagination()
+
+
+# Facet field -> the AdListView filter parameter on it. Car facets only apply to car listings, like their filters.
+AD_FACETS = {'location': 'location', 'category': 'category', 'ad_type': 'adType'}
+CAR_FACETS = {'manufacturer': 'manufacturer', 'fuel_type': 'fuelType', 'color': 'color', 'car_type': 'car_type'}
+# Histogram field -> its range filter parameters and bucket edges. Buckets run from one edge up to
+# the next, the outer two are open ended.
+AD_HISTOGRAMS = {
+    'price': ('priceFrom', 'priceTo', [500, 1000, 2500, 5000, 10000, 25000, 50000, 100000]),
+}
+CAR_HISTOGRAMS = {
+    'year': ('yearFrom', 'yearTo', [2000, 2005, 2010, 2015, 2020]),
+    'mileage': ('mileageFrom', 'mileageTo', [25000, 50000, 100000, 150000, 200000, 300000]),
+}
+
+
+def without_params(params, *names):
+    params = params.copy()
+    for name in names:
+        params.pop(name, None)
+    return params
+
+
+def range_filter(field, low, high, inclusive=True):
+    conditions = Q()
+    if low not in (None, ''):
+        conditions &= Q(**{f'{field}__gte': low})
+    if high not in (None, ''):
+        conditions &= Q(**{f'{field}__lte' if inclusive else f'{field}__lt': high})
+    return conditions
+
+
+def get_ad_facets(params):
+    """
+    Counts the ads matching the AdListView filters in ``params`` per value of every facet and per
+    histogram bucket. Each facet and histogram leaves out its own filter, so the alternatives to a
+    selected value keep their counts. Takes one grouped query per facet and one for all histograms.
+    """
+    is_car = params.get('category') == 'car'
+    facets = {**AD_FACETS, **(CAR_FACETS if is_car else {})}
+    histograms = {**AD_HISTOGRAMS, **(CAR_HISTOGRAMS if is_car else {})}
+
+    facet_counts = {}
+    for field, param in facets.items():
+        rows = filter_ad_list(without_params(params, param)).order_by().values_list(field).annotate(count=Count('pk'))
+        facet_counts[field] = [{'value': value, 'count': count}
+                               for value, count in rows.order_by('-count', field) if value is not None]
+
+    range_params = [param for from_param, to_param, _ in histograms.values() for param in (from_param, to_param)]
+    ranges = {field: range_filter(field, params.get(from_param), params.get(to_param))
+              for field, (from_param, to_param, _) in histograms.items()}
+    buckets, aggregates = {}, {}
+    for field, (_, _, edges) in histograms.items():
+        other_ranges = Q(*[conditions for other, conditions in ranges.items() if other != field])
+        buckets[field] = list(zip([None, *edges], [*edges, None]))
+        for i, (low, high) in enumerate(buckets[field]):
+            aggregates[f'{field}_{i}'] = Count('pk', filter=other_ranges & range_filter(field, low, high, False))
+    counts = filter_ad_list(without_params(params, *range_params)).order_by().aggregate(**aggregates)
+
+    return {
+        'facets': facet_counts,
+        'histograms': {
+            field: [{'from': low, 'to': high, 'count': counts[f'{field}_{i}']} for i, (low, high) in enumerate(edges)]
+            for field, edges in buckets.items()
+        },
+    }
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@etag(ad_facets_etag)
+@cache_response('ad-facets', ad_list_namespaces)
+def ad_facets(request):
+    AdFilterParamsSerializer(data=request.query_params).is_valid(raise_exception=True)
+    return Response(get_ad_facets(request.query_params))
+
+
+@method_decorator(etag(ad_list_etag), name='get')
 class AdListView(APIView):
     permission_classes = []
 
+    @cache_response('ad-list', ad_list_namespaces)
     def get(self, request):
-        category = request.query_params.get('category')
-        location = request.query_params.get('location')
-        ad_type = request.query_params.get('adType')
-        from_date = request.query_params.get('fromDate')
-        to_date = request.query_params.get('toDate')
-        manufacturer = request.query_params.get('manufacturer')
-        car_type = request.query_params.get('car_type')
-        fuel_type = request.query_params.get('fuelType')
-        color = request.query_params.get('color')
-        year_from = request.query_params.get('yearFrom')
-        year_to = request.query_params.get('yearTo')
-        price_from = request.query_params.get('priceFrom')
-        price_to = request.query_params.get('priceTo')
-        mileage_from = request.query_params.get('mileageFrom')
-        mileage_to = request.query_params.get('mileageTo')
-        search_title = request.query_params.get('search')
-        sort_by = request.query_params.get('sort')
-
-        # Get all ads
-        ads = Ad.objects.all()
-
-        if category and category != 'All':
-            ads = ads.filter(category=category)
-        if location and location != 'All':
-            ads = ads.filter(location=location)
-        if ad_type and ad_type != 'All':
-            ads = ads.filter(ad_type=ad_type)
-        if from_date:
-            ads = ads.filter(created_at__gte=from_date)
-        if to_date:
-            ads = ads.filter(created_at__lte=to_date)
-        if price_from:
-            ads = ads.filter(price__gte=price_from)
-        if price_to:
-            ads = ads.filter(price__lte=price_to)
-        if search_title:
-            ads = ads.filter(title__icontains=search_title)
-
-        if category == "car":
-            ads = CarAd.objects.filter(ad_ptr_id__in=ads.values('id'))
-            if manufacturer and manufacturer != 'All':
-                ads = ads.filter(manufacturer=manufacturer)
-            if car_type and car_type != 'All':
-                ads = ads.filter(car_type=car_type)
-            if fuel_type and fuel_type != 'All':
-                ads = ads.filter(fuel_type=fuel_type)
-            if color and color != 'All':
-                ads = ads.filter(color=color)
-            if year_from:
-                ads = ads.filter(year__gte=year_from)
-            if year_to:
-                ads = ads.filter(year__lte=year_to)
-            if mileage_from:
-                ads = ads.filter(mileage__gte=mileage_from)
-            if mileage_to:
-                ads = ads.filter(mileage__lte=mileage_to)
-
-        if sort_by:
-            if sort_by == 'newest':
-                ads = ads.order_by('-created_at')
-            elif sort_by == 'oldest':
-                ads = ads.order_by('created_at')
-            elif sort_by == 'priceLowToHigh':
-                ads = ads.order_by('price')
-            elif sort_by == 'priceHighToLow':
-                ads = ads.order_by('-price')
-
-        paginator = UserAdsPagination()
+        ads = get_ad_list_queryset(request.query_params)
+        paginator = get_ad_list_paginator(request.query_params)
         page_obj = paginator.paginate_queryset(ads, request)
 
-        serializer = AdSerializer(page_obj, many=True)
+        serializer = get_ad_list_serializer(ads, request.query_params, page_obj, many=True)
 
         response_data = paginator.get_paginated_response(serializer.data)
         return Response(response_data.data, status=status.HTTP_200_OK)
 
 
+@method_decorator(etag(ad_details_etag), name='get')
 class AdDetailsView(RetrieveAPIView):
     permission_classes = []
-    queryset = Ad.objects.all()
+    queryset = AdSerializer.setup_eager_loading(Ad.objects.all())
     serializer_class = AdSerializer
     lookup_field = 'id'
 
@@ -293,27 +585,133 @@ class FeaturedAdsView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
-        ads = Ad.objects.filter(is_featured=True)[:4]
-        serializer = AdSerializer(ads, many=True)
+        serializer = AdListingSerializer(get_featured_ads(), many=True, **get_fieldset(request.query_params))
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+SIMILAR_ADS_COUNT = 4
+
+
+def get_similar_ads_queryset(ad_id, category, similar_ids):
+    """
+    The listings of the ads precomputed as similar to ``ad_id``, in no particular order. Until
+    compute_similar_ads has run for the ad, the newest ads of its category stand in.
+    """
+    if similar_ids:
+        return AdListing.objects.filter(id__in=similar_ids).only('id', 'payload')
+    listings = AdListing.objects.filter(category=category).exclude(id=ad_id).order_by('-created_at', '-id')
+    return listings.only('id', 'payload')[:SIMILAR_ADS_COUNT]
+
+
+def sort_similar_ads(listings, similar_ids):
+    # Ads deleted since the ids were computed are simply missing, the spare ids fill in for them.
+    positions = {ad_id: i for i, ad_id in enumerate(similar_ids)}
+    return sorted(listings, key=lambda listing: positions.get(listing.id, 0))[:SIMILAR_ADS_COUNT]
+
+
 class SimilarAdsView(APIView):
     permission_classes = [AllowAny]
 
+    @cache_response('similar-ads', similar_ads_namespaces)
     def get(self, request, ad_id):
-        try:
-            ad = Ad.objects.get(id=ad_id)
-        except Ad.DoesNotExist:
+        listing = AdListing.objects.filter(id=ad_id).values_list('category', 'similar_ids').first()
+        if listing is None:
             return Response({"error": "Ad not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        similar_ads = Ad.objects.filter(category=ad.category).exclude(id=ad_id)[:4]
-        serializer = AdSerializer(similar_ads, many=True)
+        fieldset = get_fieldset(request.query_params)
+        similar_ads = AdListingSerializer(**fieldset).setup_sparse_loading(get_similar_ads_queryset(ad_id, *listing))
+        serializer = AdListingSerializer(sort_similar_ads(similar_ads, listing[1]), many=True, **fieldset)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class ImportAdsView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = get_file_format(upload.name, request.data.get('file_format'))
+        if file_format is None:
+            return Response({"error": "Expected a .csv or .jsonl file"}, status=status.HTTP_400_BAD_REQUEST)
+
+        summary = import_ads(read_rows(upload, file_format), request.user)
+        return Response(summary, status=status.HTTP_201_CREATED if summary['created'] else status.HTTP_400_BAD_REQUEST)
+
+
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+
+
+def export_response(request, queryset, file_format):
+    if file_format not in EXPORT_CONTENT_TYPES:
+        return Response({"error": "Expected csv or jsonl"}, status=status.HTTP_404_NOT_FOUND)
+    content = streaming_content(request, export_chunks(queryset, file_format))
+    response = StreamingHttpResponse(content, content_type=EXPORT_CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="ads.{file_format}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_ads(request, file_format):
+    return export_response(request, Ad.objects.all(), file_format)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_user_ads(request, file_format):
+    return export_response(request, Ad.objects.filter(owner=request.user), file_format)
+
+
 # AD API END
 
+# AUCTION API
+class AuctionDetailsView(RetrieveAPIView):
+    permission_classes = [AllowAny]
+    queryset = Auction.objects.all()
+    serializer_class = AuctionSerializer
+    lookup_url_kwarg = 'auction_id'
+
+
+class PlaceBidView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, auction_id):
+        serializer = PlaceBidSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            bid = place_bid(auction_id, request.user, serializer.validated_data['bid_amount'])
+        except Auction.DoesNotExist:
+            return Response({"error": "Auction not found"}, status=status.HTTP_404_NOT_FOUND)
+        except BidRejected as e:
+            return Response({"error": e.message, "current_price": e.current_price}, status=status.HTTP_409_CONFLICT)
+        return Response(BidSerializer(bid).data, status=status.HTTP_201_CREATED)
+
+
+async def auction_stream(request, auction_id):
+    """
+    Pushes the price of an auction as server-sent events instead of having clients poll it.
+    Only routed by oglasBE.asgi_urls, a WSGI worker would be held for the whole stream.
+    """
+    broker = get_broker()
+    channel = await broker.subscribe(auction_id)
+    # Subscribe before reading so a bid committed in between is still pushed afterwards.
+    sequence = channel.sequence
+    state = await Auction.objects.filter(id=auction_id).values('current_price', 'end_time', 'is_closed').afirst()
+    if state is None:
+        broker.unsubscribe(auction_id, channel)
+        return JsonResponse({"error": "Auction not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(auction_events(auction_id, channel, sequence, state),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# AUCTION API END
+
 # WISHLIST API
 class WishlistViewSet(viewsets.ModelViewSet):
     queryset = Wishlist.objects.all()
@@ -326,20 +724,54 @@ class AddToWishlist(APIView):
         ad_id = request.data.get('ad_id')
         user = request.user
 
-        if Wishlist.objects.filter(ad_id=ad_id, user=user).exists():
+        # A single INSERT, the unique constraint turns away ads that are already saved.
+        try:
+            with transaction.atomic():
+                wishlist_item = Wishlist.objects.create(user=user, ad_id=ad_id)
+        except IntegrityError:
+            if not Ad.objects.filter(id=ad_id).exists():
+                return Response({"error": "Ad not found"}, status=status.HTTP_404_NOT_FOUND)
             return Response({'message': 'Ad is already in the wishlist'}, status=status.HTTP_400_BAD_REQUEST)
 
-        wishlist_item = Wishlist.objects.create(user=user, ad_id=ad_id)
         serializer = WishlistSerializer(wishlist_item)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+@method_decorator(etag(wishlist_etag), name='get')
 class WishlistView(APIView):
+    # ?projection=card swaps the full ads for cards, ?fields= and ?expand= pick fields of either.
     def get(self, request):
         user = request.user
-        wishlist_items = Wishlist.objects.filter(user=user)
-        serializer = WishlistSerializer(wishlist_items, many=True)
-        return Response(serializer.data)
+        if request.query_params.get('projection') == 'card':
+            serializer_class = WishlistCardSerializer
+        else:
+            serializer_class = WishlistSerializer
+        fieldset = get_fieldset(request.query_params)
+
+        wishlist_items = Wishlist.objects.filter(user=user).order_by('-id')
+        wishlist_items = serializer_class(**fieldset).setup_sparse_loading(wishlist_items)
+        paginator = UserAdsPagination()
+        page = paginator.paginate_queryset(wishlist_items, request)
+        serializer = serializer_class(page, many=True, **fieldset)
+        return paginator.get_paginated_response(serializer.data)
+
+
+WISHLIST_MEMBERSHIP_MAX_IDS = 200
+
+
+@api_view(['GET'])
+def wishlist_membership(request):
+    """Which of the comma separated ``ids`` the user saved, for the hearts on a page of ads."""
+    try:
+        ad_ids = list(dict.fromkeys(int(ad_id) for ad_id in request.query_params.get('ids', '').split(',') if ad_id))
+    except ValueError:
+        return Response({"error": "ids must be comma separated ad ids"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ad_ids) > WISHLIST_MEMBERSHIP_MAX_IDS:
+        return Response({"error": f"At most {WISHLIST_MEMBERSHIP_MAX_IDS} ids per request"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    saved = get_wishlist_ad_ids(request.user)
+    return Response({'ids': [ad_id for ad_id in ad_ids if ad_id in saved]})
 
 
 class RemoveFromWishlist(APIView):
@@ -0,0 +1,27 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Wishlist
+
+WISHLIST_IDS_TIMEOUT = 60 * 10
+
+
+def wishlist_key(user_id):
+    return f'wishlist:{user_id}'
+
+
+def get_wishlist_ad_ids(user):
+    """The ids of the ads ``user`` saved, cached per user and otherwise read from the (user, ad) index alone."""
+    ad_ids = cache.get(wishlist_key(user.pk))
+    if ad_ids is None:
+        ad_ids = set(Wishlist.objects.filter(user=user).values_list('ad_id', flat=True))
+        cache.set(wishlist_key(user.pk), ad_ids, WISHLIST_IDS_TIMEOUT)
+    return ad_ids
+
+
+@receiver(post_save, sender=Wishlist)
+@receiver(post_delete, sender=Wishlist)
+def forget_wishlist_ad_ids(sender, instance, **kwargs):
+    # Also sent for the items of deleted ads and users, having a receiver turns off fast deletes.
+    cache.delete(wishlist_key(instance.user_id))
@@ -2,6 +2,8 @@
 ASGI config for oglasBE project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the app through it (e.g. uvicorn oglasBE.asgi:application) for the auction streams and
+the async versions of the ad browsing endpoints.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -12,5 +14,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'oglasBE.settings')
+os.environ.setdefault('DJANGO_ROOT_URLCONF', 'oglasBE.asgi_urls')
 
 application = get_asgi_application()
@@ -0,0 +1,27 @@
+"""
+URL configuration of the ASGI entry point.
+
+Same routes as oglasBE.urls, except that the hot public read endpoints are served by the native
+async views of oglas.async_views instead of the sync DRF views. The auction streams are only
+routed here, under WSGI every open stream would hold a worker thread.
+"""
+from django.urls import path
+
+from oglas import async_views
+from oglas.views import auction_stream
+from .urls import urlpatterns as sync_urlpatterns
+
+async_read_views = {
+    'ad-list': async_views.ad_list,
+    'ad-details': async_views.ad_details,
+    'featured-ads': async_views.featured_ads,
+    'similar-ads': async_views.similar_ads,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), async_read_views[pattern.name], name=pattern.name)
+    if getattr(pattern, 'name', None) in async_read_views else pattern
+    for pattern in sync_urlpatterns
+] + [
+    path('auctions/<int:auction_id>/stream/', auction_stream, name='auction-stream'),
+]
@@ -1,6 +1,5 @@
+import os
 from pathlib import Path
-import firebase_admin
-from firebase_admin import credentials, storage
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -24,6 +23,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'oglas',
     'django.contrib.sites',
     'allauth',
@@ -43,13 +43,18 @@ AUTH_USER_MODEL = 'oglas.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
+        'oglas.authentication.AccessTokenAuthentication',
+        'oglas.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'oglas.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 # Email configuration for sending real emails
@@ -70,6 +75,13 @@ ACCOUNT_EMAIL_CONFIRMATION_AUTHENTICATED_REDIRECT_URL = '/email-confirmed/'
 ACCOUNT_EMAIL_CONFIRMATION_ANONYMOUS_REDIRECT_URL = '/email-confirmed/'
 ACCOUNT_EMAIL_CONFIRMATION_EXPIRE_DAYS = 3
 
+# Access tokens
+# Signed bearer tokens from /auth/access-token/, checked without a database query. Seconds.
+ACCESS_TOKEN_LIFETIME = 15 * 60
+# Seconds a resolved user stays cached for token and session requests, saves evict it sooner.
+PRINCIPAL_CACHE_TIMEOUT = 5 * 60
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 # Django settings.py
 AUTHENTICATION_BACKENDS = [
     'oglas.backends.CustomAuthBackend',
@@ -92,6 +104,7 @@ TEMPLATES = [
 ]
 
 MIDDLEWARE = [
+    'oglas.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -103,6 +116,16 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
 ]
+# Per route query, DB, serializer and latency counters, see 'manage.py request_metrics'.
+REQUEST_METRICS = True
+# Adds a Server-Timing header with the numbers to every response, for debugging. Without it a
+# request can still opt in by sending REQUEST_METRICS_TOKEN in an X-Request-Metrics header.
+REQUEST_METRICS_HEADER = os.environ.get('REQUEST_METRICS_HEADER') == '1'
+REQUEST_METRICS_TOKEN = os.environ.get('REQUEST_METRICS_TOKEN')
+REQUEST_METRICS_FLUSH_INTERVAL = 10
+# Requests repeating one statement at least this often are reported as N+1 suspects.
+REQUEST_METRICS_N_PLUS_ONE_THRESHOLD = 5
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "https://oglas-1b0b6.firebaseapp.com",
@@ -110,7 +133,8 @@ CORS_ALLOWED_ORIGINS = [
 ]
 CORS_ALLOW_CREDENTIALS = True
 
-ROOT_URLCONF = 'oglasBE.urls'
+# oglasBE/asgi.py switches to oglasBE.asgi_urls, which serves the hot read endpoints with async views.
+ROOT_URLCONF = os.environ.get('DJANGO_ROOT_URLCONF', 'oglasBE.urls')
 
 WSGI_APPLICATION = 'oglasBE.wsgi.application'
 
@@ -127,6 +151,39 @@ DATABASES = {
     }
 }
 
+# Cache
+# Local memory by default; point REDIS_URL at a Redis server to share the caches between workers.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'responses': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'responses',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'responses': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'responses',
+        },
+    }
+
+# Auction streams
+# Bids are pushed to watchers over server-sent events. The in-process broker only reaches watchers
+# connected to the publishing process, Redis pub/sub reaches every ASGI worker.
+AUCTION_BROKER = 'oglas.realtime.RedisBroker' if REDIS_URL else 'oglas.realtime.InProcessBroker'
+# Seconds between keepalive comments on an idle stream.
+AUCTION_STREAM_KEEPALIVE = 15
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -144,12 +201,15 @@ AUTH_PASSWORD_VALIDATORS = [
         'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
     },
 ]
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate("D:\oglas-fe/oglas-1b0b6-firebase-adminsdk-c2ajn-c0aae977f4.json")
-firebase_admin.initialize_app(cred, {
-    'storageBucket': 'oglas-1b0b6.appspot.com'
-})
-firebase_storage_bucket = storage.bucket()
+# Image storage
+# Backend behind oglas.storage.get_storage_client(). Firebase is initialized lazily on first use;
+# oglas.storage.LocalFileSystemStorageClient and InMemoryStorageClient need no credentials.
+IMAGE_STORAGE_CLIENT = os.environ.get('IMAGE_STORAGE_CLIENT', 'oglas.storage.FirebaseStorageClient')
+IMAGE_STORAGE_ROOT = BASE_DIR / 'media'
+FIREBASE_CREDENTIALS = os.environ.get('FIREBASE_CREDENTIALS',
+                                      r"D:\oglas-fe/oglas-1b0b6-firebase-adminsdk-c2ajn-c0aae977f4.json")
+FIREBASE_STORAGE_BUCKET = 'oglas-1b0b6.appspot.com'
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
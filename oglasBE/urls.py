@@ -22,10 +22,12 @@ from rest_framework.routers import DefaultRouter
 from oglas.views import AdViewSet, WishlistViewSet, \
     CustomConfirmEmailView, CustomRegisterView, get_authenticated_user_info, UserProfileUpdateView, get_choices, \
     UserAdsViewSet, AdListView, AdDetailsView, DeleteAdView, edit_ad, AddToWishlist, WishlistView, RemoveFromWishlist, \
-    FeaturedAdsView, SimilarAdsView
+    FeaturedAdsView, SimilarAdsView, cache_stats, AuctionDetailsView, PlaceBidView, \
+    ImportAdsView, export_ads, export_user_ads, ad_facets, AccessTokenView, wishlist_membership
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('auth/access-token/', AccessTokenView.as_view(), name='access-token'),
     path('auth/', include('dj_rest_auth.urls')),
     path('auth/registration/', include('dj_rest_auth.registration.urls')),
     path('auth/registration/custom/', CustomRegisterView.as_view(), name='custom_register'),
@@ -36,16 +38,25 @@ urlpatterns = [
     path('user-info/', get_authenticated_user_info, name='get_authenticated_user_info'),
     path('edit-profile/', UserProfileUpdateView.as_view(), name='user-profile-update'),
     path('api/choices/', get_choices, name='get_choices'),
+    path('api/cache-stats/', cache_stats, name='cache_stats'),
     path('ad/add/', AdViewSet.as_view({'post': 'create'}), name='ad-add'),
     path('user-ads/', UserAdsViewSet.as_view({'get': 'list'}), name='user-ads'),
+    path('user-ads/export/<str:file_format>/', export_user_ads, name='user-ads-export'),
+    path('ads/import/', ImportAdsView.as_view(), name='ads-import'),
+    path('ads/export/<str:file_format>/', export_ads, name='ads-export'),
     path('ads/', AdListView.as_view(), name='ad-list'),
+    path('ads/facets/', ad_facets, name='ad-facets'),
     path('ad/<int:id>/', AdDetailsView.as_view(), name='ad-details'),
     path('ad/edit/<int:ad_id>/', edit_ad, name='ad-edit'),
     path('ad/delete/<int:pk>/', DeleteAdView.as_view(), name='ad-delete'),
     path('wishlist/add/', AddToWishlist.as_view(), name='add_to_wishlist'),
     path('wishlist/', WishlistView.as_view(), name='wishlist'),
+    path('wishlist/contains/', wishlist_membership, name='wishlist-contains'),
     path('wishlist/remove/<int:ad_id>/', RemoveFromWishlist.as_view(), name='remove_from_wishlist'),
     path('ads/featured/', FeaturedAdsView.as_view(), name='featured-ads'),
     path('ads/similar/<int:ad_id>/', SimilarAdsView.as_view(), name='similar-ads'),
+    path('auctions/<int:auction_id>/', AuctionDetailsView.as_view(), name='auction-details'),
+    path('auctions/<int:auction_id>/bid/', PlaceBidView.as_view(), name='place-bid'),
+    # auctions/<id>/stream/ is only routed by oglasBE.asgi_urls.
 
 ]